@@ -0,0 +1,75 @@
+import os, time, threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Optional
+
+class TileDownloader:
+    """  Concurrent HTTP file fetcher: a thread pool with bounded concurrency per host and a keep-alive session per thread.
+         Failed transfers are retried with exponential backoff, resuming the partial (.part) file with a Range request,
+         and each file is atomically renamed into place once complete. """
+
+    def __init__( self, max_workers: int = 8, max_per_host: int = 4, retries: int = 4, backoff: float = 1.0, timeout: float = 60.0, chunk_size: int = 1 << 20 ):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+        self._host_slots: Dict[str,threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def session( self ) -> requests.Session:
+        session: Optional[requests.Session] = getattr( self._local, 'session', None )
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter( pool_connections=4, pool_maxsize=self.max_per_host )
+            session.mount( "http://", adapter )
+            session.mount( "https://", adapter )
+            self._local.session = session
+        return session
+
+    def host_slot( self, url: str ) -> threading.BoundedSemaphore:
+        host = urlparse( url ).netloc
+        with self._lock:
+            return self._host_slots.setdefault( host, threading.BoundedSemaphore( self.max_per_host ) )
+
+    def fetch( self, url: str, file_path: str ) -> bool:
+        """ Downloads url to file_path, returning False if the file does not exist on the server or all retries fail """
+        part_path = file_path + ".part"
+        for attempt in range( self.retries + 1 ):
+            try:
+                with self.host_slot( url ):
+                    status = self.fetch_part( url, part_path )
+                if status == "missing": return False
+                os.replace( part_path, file_path )
+                return True
+            except ( requests.RequestException, OSError ) as err:
+                print( f"     ---> Error downloading {url} (attempt {attempt+1} of {self.retries+1}): {err}" )
+            if attempt < self.retries: time.sleep( self.backoff * 2 ** attempt )
+        return False
+
+    def fetch_part( self, url: str, part_path: str ) -> str:
+        offset = os.path.getsize( part_path ) if os.path.isfile( part_path ) else 0
+        headers = { 'Range': f'bytes={offset}-' } if offset > 0 else {}
+        with self.session().get( url, headers=headers, stream=True, timeout=self.timeout ) as response:
+            if ( response.status_code == 416 ) and ( offset > 0 ): return "complete"
+            if ( 400 <= response.status_code < 500 ) and ( response.status_code not in ( 408, 429 ) ): return "missing"
+            response.raise_for_status()
+            expected_size = response.headers.get( 'Content-Length' )
+            written = 0
+            with open( part_path, "ab" if response.status_code == 206 else "wb" ) as part_file:
+                for chunk in response.iter_content( self.chunk_size ):
+                    part_file.write( chunk )
+                    written = written + len( chunk )
+            if ( expected_size is not None ) and ( written < int( expected_size ) ):
+                raise IOError( f"Transfer interrupted after {written} of {expected_size} bytes" )
+        return "complete"
+
+    def fetch_all( self, jobs: List[Tuple[str,str]] ) -> List[bool]:
+        """ Downloads a list of ( url, file_path ) jobs concurrently, returning the success of each job in order """
+        if len( jobs ) == 0: return []
+        with ThreadPoolExecutor( max_workers = min( self.max_workers, len( jobs ) ) ) as executor:
+            return list( executor.map( lambda job: self.fetch( *job ), jobs ) )
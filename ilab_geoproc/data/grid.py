@@ -5,7 +5,7 @@ from affine import Affine
 from typing import Dict, List, Tuple, Union, Optional
 import numpy as np
 from osgeo import gdal, gdalconst, ogr, osr
-from pyproj import Proj, transform
+from pyproj import Proj
 from geoproc.util.crs import CRS
 import xarray as xr
 import utm
@@ -86,8 +86,7 @@ class GDALGrid(object):
         """Returns (projected) bounding coordinates for the dataset: (x_min, x_max, y_min, y_max)  """
         new_proj = None
         if as_geographic:
-            new_proj = osr.SpatialReference()
-            new_proj.ImportFromEPSG(4326)
+            new_proj = CRS.geographic_sref()
         elif as_utm:
             new_proj = self.get_utm_proj()
         elif as_projection:
@@ -143,10 +142,7 @@ class GDALGrid(object):
 
     def lonlat2pixel(self, longitude: float, latitude: float ) -> Tuple[int,int]:
         """ Returns base-0 raster index using longitude and latitude of pixel center """
-        sp_ref = osr.SpatialReference()
-        sp_ref.ImportFromEPSG(4326)  # geographic
-        transx = osr.CoordinateTransformation(sp_ref, self.projection)
-        x_coord, y_coord = transx.TransformPoint(longitude, latitude)[:2]
+        x_coord, y_coord = CRS.transform( CRS.GEOGRAPHIC, self.projection, longitude, latitude )
         return self.coord2pixel(x_coord, y_coord)
 
     @property
@@ -165,7 +161,7 @@ class GDALGrid(object):
     def latlon(self) -> Tuple[np.array,np.array]:
         """Returns ( latitude, longitude ) array tuple representing the grid. """
         x_2d_coords, y_2d_coords = np.meshgrid(self.x_coords, self.y_coords)
-        proj_lons, proj_lats = transform(self.proj, Proj(init='epsg:4326'), x_2d_coords, y_2d_coords)
+        proj_lons, proj_lats = CRS.transform( self.projection, CRS.GEOGRAPHIC, x_2d_coords, y_2d_coords )
         return proj_lats, proj_lons
 
     def np_array(self, band: int = 1, masked: bool =True) -> np.array:
@@ -180,8 +176,31 @@ class GDALGrid(object):
                 return np.ma.array(data=grid_data, mask=(grid_data == nodata_value))
         return np.array(grid_data)
 
-    def xarray( self, name: str, band: int = -1, masked: bool = True, time_axis = None ) -> xr.DataArray:
-        xy_data = self.np_array( band, masked )
+    def lazy_array(self, band: int = -1, chunks: Tuple[int,int] = None, masked: bool = False ):
+        """Returns the raster band (or all bands as a 3D array if band < 0) as a dask array whose chunks are aligned to the GDAL block size.
+           Only the windows touched by downstream indexing are read.  As in np_array, if masked and band >= 0 nodata values are set to NaN.
+           File-backed datasets get a deterministic dask name (path, mtime, band, chunks); in-memory datasets get a unique one. """
+        import dask.array as da
+        from dask.base import tokenize
+        reader = GDALWindowReader( self, band )
+        if chunks is None:
+            bx, by = reader.block_size
+            chunks = ( by * max( 1, 512 // by ), bx * max( 1, 512 // bx ) )
+        chunks = tuple( chunks ) if band >= 0 else ( 1, ) + tuple( chunks )
+        path = self.dataset.GetDescription()
+        name = f"gdal-{tokenize( os.path.abspath(path), os.path.getmtime(path), band, chunks )}" if os.path.isfile( path ) else False
+        data = da.from_array( reader, chunks = chunks, lock = reader.lock, asarray = False, name = name )
+        nodata_value = self.dataset.GetRasterBand(band).GetNoDataValue() if band >= 0 else None
+        if masked and ( nodata_value is not None ):
+            data = da.where( data == nodata_value, np.nan, data.astype( np.result_type( data.dtype, np.float32 ) ) )
+        return data
+
+    def xarray( self, name: str, band: int = -1, masked: bool = True, time_axis = None, lazy: bool = False ) -> xr.DataArray:
+        xy_data = self.lazy_array( band, masked = masked ) if lazy else self.np_array( band, masked )
+        return self.wrap_array( xy_data, name, time_axis )
+
+    def wrap_array( self, xy_data: np.ndarray, name: str, time_axis = None ) -> xr.DataArray:
+        """ Wraps a (y, x) or (time, y, x) array defined on this grid as an xarray DataArray """
         transform = self.geotransform
         attrs = dict( crs=self.projection.ExportToProj4(), transform=transform )
         if transform[2] == 0 and transform[4] == 0: attrs["res"] = [ transform[1], transform[5] ]
@@ -220,6 +239,52 @@ class GDALGrid(object):
         x_pixel, y_pixel = self.coord2pixel(x_coord, y_coord)
         return self.get_val(x_pixel, y_pixel, band)
 
+    def sample_points(self, lons: np.ndarray, lats: np.ndarray, bands: Union[int,List[int]] = 1, geographic: bool = True ) -> np.ma.MaskedArray:
+        """Returns raster values at many points, reading each raster block that contains points only once.
+
+        Parameters
+        ----------
+        lons: array-like
+            Longitudes (or projected x coordinates if geographic is False) of the points.
+        lats: array-like
+            Latitudes (or projected y coordinates if geographic is False) of the points.
+        bands: int or list of int, optional
+            Band number(s) (1-based). Default is 1.
+        geographic: bool, optional
+            If True (default) the points are transformed from EPSG:4326 to the dataset's projection.
+
+        Returns
+        -------
+        :obj:`numpy.ma.MaskedArray`
+            Shape (npoints,) for a single band, (nbands, npoints) for a list of bands.  Points outside the grid are masked.
+        """
+        x_coords, y_coords = np.asarray( lons, dtype=np.float64 ).ravel(), np.asarray( lats, dtype=np.float64 ).ravel()
+        if geographic:
+            x_coords, y_coords = CRS.transform( CRS.GEOGRAPHIC, self.projection, x_coords, y_coords )
+        band_list = [ bands ] if isinstance( bands, int ) else list( bands )
+        cols, rows = ~self.affine * ( np.asarray( x_coords ), np.asarray( y_coords ) )
+        cols, rows = np.floor( cols ).astype( np.int64 ), np.floor( rows ).astype( np.int64 )
+        inside = ( cols >= 0 ) & ( cols < self.x_size ) & ( rows >= 0 ) & ( rows < self.y_size )
+        dtype = self.dataset.GetRasterBand( band_list[0] ).ReadAsArray( 0, 0, 1, 1 ).dtype
+        values = np.zeros( [ len(band_list), cols.size ], dtype=dtype )
+        bx, by = self.dataset.GetRasterBand( band_list[0] ).GetBlockSize()
+        point_indices = np.nonzero( inside )[0]
+        block_ids = ( rows[point_indices] // by ) * ( ( self.x_size + bx - 1 ) // bx ) + ( cols[point_indices] // bx )
+        order = np.argsort( block_ids, kind="stable" )
+        block_ids, point_indices = block_ids[order], point_indices[order]
+        block_starts = np.nonzero( np.diff( block_ids, prepend=-1 ) )[0]
+        for iB, start in enumerate( block_starts ):
+            stop = block_starts[iB+1] if iB+1 < len(block_starts) else len(block_ids)
+            block_points = point_indices[ start:stop ]
+            x0, y0 = ( cols[block_points[0]] // bx ) * bx, ( rows[block_points[0]] // by ) * by
+            nx, ny = min( bx, self.x_size - x0 ), min( by, self.y_size - y0 )
+            for iBand, band in enumerate( band_list ):
+                block: np.ndarray = self.dataset.GetRasterBand( band ).ReadAsArray( int(x0), int(y0), int(nx), int(ny) )
+                values[ iBand, block_points ] = block[ rows[block_points] - y0, cols[block_points] - x0 ]
+        mask = np.broadcast_to( ~inside, values.shape )
+        result = np.ma.array( values, mask=mask )
+        return result[0] if isinstance( bands, int ) else result
+
     def write_prj(self, out_projection_file: str, esri_format: bool =False ):
         """Writes projection file to Output path (optionally in Esri format). """
         if esri_format:
@@ -316,6 +381,7 @@ class GDALGrid(object):
         nx =  kwargs.get( 'nx',None  )
         ny = kwargs.get( 'ny', None )
         resolution = kwargs.get('resolution', None)
+        dtype = kwargs.get( 'dtype', None )
         newbounds = self.bounds( as_projection=dstSRS )
         mem_drv = gdal.GetDriverByName('MEM')
         nBands = self.dataset.RasterCount
@@ -323,12 +389,22 @@ class GDALGrid(object):
             nx, ny = int(round((newbounds[1] - newbounds[0]) / resolution[0])), int(round((newbounds[3] - newbounds[2]) / resolution[1]))
         elif nx is not None and ny is not None:
             resolution = [ (newbounds[1] - newbounds[0]) / nx, (newbounds[3] - newbounds[2]) / ny ]
-        dest: gdal.Dataset = mem_drv.Create('', nx, ny, nBands, gdal.GDT_Float32)
+        dest: gdal.Dataset = mem_drv.Create('', nx, ny, nBands, gdal.GDT_Float32 if dtype is None else dtype )
         new_geo = (newbounds[0], resolution[0], 0.0,  newbounds[3], 0.0, -resolution[1] )
         srcWkt = self.wkt
         destWkt = dstSRS.ExportToWkt()
         dest.SetGeoTransform( new_geo )
         dest.SetProjection ( destWkt )
+        fill = kwargs.get( 'fill', None )
+        if fill is not None:
+            for iBand in range( 1, nBands + 1 ):
+                dest.GetRasterBand( iBand ).Fill( fill )
+        elif dtype is not None:
+            for iBand in range( 1, nBands + 1 ):
+                nodata_value = self.dataset.GetRasterBand( iBand ).GetNoDataValue()
+                if nodata_value is not None:
+                    dest.GetRasterBand( iBand ).SetNoDataValue( nodata_value )
+                    dest.GetRasterBand( iBand ).Fill( nodata_value )
         res = gdal.ReprojectImage( self.dataset, dest, srcWkt, destWkt, resampling )
         return GDALGrid( dest )
 
@@ -360,11 +436,8 @@ class GDALGrid(object):
 
     @classmethod
     def project_to_geographic(cls, x_coord: float, y_coord: float, osr_projetion: osr.SpatialReference) -> Tuple[float,float]:
-        """ Project point to EPSG:4326 """
-        sp_ref = osr.SpatialReference()
-        sp_ref.ImportFromEPSG(4326)
-        trans = osr.CoordinateTransformation(osr_projetion, sp_ref)
-        return trans.TransformPoint(x_coord, y_coord)[:2]
+        """ Project point (or coordinate arrays) to EPSG:4326 """
+        return CRS.transform( osr_projetion, CRS.GEOGRAPHIC, x_coord, y_coord )
 
     @classmethod
     def load_raster(cls, grid: Union[str,gdal.Dataset]) -> Tuple[ "GDALGrid", str ]:
@@ -446,6 +519,97 @@ class GDALGrid(object):
         return GDALGrid(reprojected_ds)
 
 
+class GDALWindowReader(object):
+    """
+    Array-like view of a :class:`GDALGrid` band (or of all bands if band < 0) whose
+    __getitem__ reads only the window covered by the requested slices.
+    """
+    def __init__(self, grid: GDALGrid, band: int = -1 ):
+        from osgeo import gdal_array
+        import threading
+        self.grid = grid
+        self.band = band
+        raster_band = grid.dataset.GetRasterBand( 1 if band < 0 else band )
+        self.dtype = np.dtype( gdal_array.GDALTypeCodeToNumericTypeCode( raster_band.DataType ) )
+        self.block_size = raster_band.GetBlockSize()
+        self.shape = ( grid.y_size, grid.x_size ) if band >= 0 else ( grid.num_bands, grid.y_size, grid.x_size )
+        self.ndim = len( self.shape )
+        self.lock = threading.Lock()
+
+    @classmethod
+    def window(cls, key, size: int ) -> Tuple[Tuple[int,int],object]:
+        """ Returns the ( start, stop ) window covering key along one axis, and the key to apply within that window """
+        if isinstance( key, slice ) and key.step in ( None, 1 ):
+            start, stop, _ = key.indices( size )
+            return ( start, max( start, stop ) ), slice( 0, max( 0, stop - start ) )
+        return ( 0, size ), key
+
+    def __getitem__(self, key ) -> np.ndarray:
+        key = key if isinstance( key, tuple ) else ( key, )
+        key = key + ( slice(None), ) * ( self.ndim - len(key) )
+        ( y0, y1 ), ykey = self.window( key[-2], self.shape[-2] )
+        ( x0, x1 ), xkey = self.window( key[-1], self.shape[-1] )
+        if ( y1 == y0 ) or ( x1 == x0 ):
+            data = np.zeros( self.shape[:-2] + ( y1 - y0, x1 - x0 ), dtype=self.dtype )
+        elif self.band >= 0:
+            data = self.grid.dataset.GetRasterBand( self.band ).ReadAsArray( x0, y0, x1 - x0, y1 - y0 )
+        else:
+            data = self.grid.dataset.ReadAsArray( x0, y0, x1 - x0, y1 - y0 )
+            if data.ndim == 2: data = data[np.newaxis]
+        return data[ key[:-2] + ( ykey, xkey ) ]
+
+
+class WarpPlan(object):
+    """
+    Precomputed nearest-neighbour reprojection from a source grid to a target projection and resolution.
+
+    The source pixel feeding each target pixel is found once, by warping a raster of source pixel indices with
+    GDAL, so applying the plan to a (time, y, x) cube is a single numpy gather.  Plans are cached by source grid,
+    target projection and resolution.
+    """
+    _plans: Dict[Tuple,"WarpPlan"] = None
+    max_cached_plans = 32
+
+    def __init__(self, src_grid: GDALGrid, dst_srs: osr.SpatialReference, resolution: Tuple[float,float] ):
+        self.src_shape = ( src_grid.y_size, src_grid.x_size )
+        index_ds: gdal.Dataset = gdal.GetDriverByName('MEM').Create( "", src_grid.x_size, src_grid.y_size, 1, gdal.GDT_Int32 )
+        index_ds.SetGeoTransform( src_grid.geotransform )
+        index_ds.SetProjection( src_grid.wkt )
+        index_ds.GetRasterBand(1).WriteArray( np.arange( src_grid.x_size * src_grid.y_size, dtype=np.int32 ).reshape( self.src_shape ) )
+        index_grid: GDALGrid = GDALGrid( index_ds ).reproject( dst_srs, resolution=resolution, dtype=gdal.GDT_Int32, fill=-1 )
+        self.dst_grid: GDALGrid = index_grid
+        self.index: np.ndarray = index_grid.np_array( 1, masked=False ).ravel()
+        self.valid: np.ndarray = self.index >= 0
+        self.dst_shape = ( index_grid.y_size, index_grid.x_size )
+
+    @classmethod
+    def key(cls, src_grid: GDALGrid, dst_srs: osr.SpatialReference, resolution: Tuple[float,float] ) -> Tuple:
+        return ( tuple( src_grid.geotransform ), src_grid.y_size, src_grid.x_size, src_grid.wkt, dst_srs.ExportToWkt(), tuple( float(r) for r in resolution ) )
+
+    @classmethod
+    def get(cls, src_grid: GDALGrid, dst_srs: osr.SpatialReference, resolution: Tuple[float,float] ) -> "WarpPlan":
+        """ Returns the cached plan for this source grid, target projection and resolution, building it if necessary. """
+        import collections
+        if cls._plans is None: cls._plans = collections.OrderedDict()
+        key = cls.key( src_grid, dst_srs, resolution )
+        plan = cls._plans.get( key )
+        if plan is None:
+            plan = WarpPlan( src_grid, dst_srs, resolution )
+            cls._plans[key] = plan
+            while len( cls._plans ) > cls.max_cached_plans: cls._plans.popitem( last=False )
+        else:
+            cls._plans.move_to_end( key )
+        return plan
+
+    def apply(self, data: np.ndarray, fill_value = 0, nodata = None ) -> np.ndarray:
+        """ Reprojects a (y, x) or (..., y, x) array defined on the source grid; target pixels outside the source (or mapped to nodata) get fill_value. """
+        flat_data = data.reshape( data.shape[:-2] + ( -1, ) )
+        result = np.take( flat_data, np.where( self.valid, self.index, 0 ), axis=-1 )
+        invalid = ~self.valid if nodata is None else ( ~self.valid | ( result == nodata ) )
+        result[ ..., invalid ] = fill_value
+        return result.reshape( data.shape[:-2] + self.dst_shape )
+
+
 if __name__ == '__main__':
     import xarray as xr
 
@@ -0,0 +1,51 @@
+import os, sqlite3
+from contextlib import contextmanager
+from typing import List, Union, Tuple, Dict, Optional
+
+class TileManifest:
+    """  Persistent SQLite index of the files in a local MWP archive (one database per data_dir), recording path, size, mtime and a
+         validated flag (NULL = not yet checked, 1 = readable, 0 = damaged).  Each refresh is a single os.scandir walk of a location
+         directory; the validated flag is reset whenever a file's size or mtime changes, so only changed files need to be re-checked. """
+
+    FILE_NAME = "mwp_manifest.sqlite"
+
+    def __init__( self, data_dir: str ):
+        self.data_dir = data_dir
+        self.db_path = os.path.join( data_dir, self.FILE_NAME )
+        os.makedirs( data_dir, exist_ok=True )
+        with self.connect() as db:
+            db.execute( "CREATE TABLE IF NOT EXISTS files ( location TEXT, name TEXT, size INTEGER, mtime REAL, validated INTEGER, PRIMARY KEY ( location, name ) )" )
+
+    @contextmanager
+    def connect( self ):
+        db = sqlite3.connect( self.db_path, timeout=60.0 )
+        try:
+            with db: yield db
+        finally:
+            db.close()
+
+    def refresh( self, location: str ) -> Dict[str,Optional[int]]:
+        """ Re-scans the location directory, updating the manifest, and returns { file name: validated flag } for the files present """
+        location_dir = os.path.join( self.data_dir, location )
+        scanned: Dict[str,Tuple[int,float]] = {}
+        if os.path.isdir( location_dir ):
+            for entry in os.scandir( location_dir ):
+                if entry.is_file() and entry.name.endswith(".tif"):
+                    stat = entry.stat()
+                    scanned[ entry.name ] = ( stat.st_size, stat.st_mtime )
+        with self.connect() as db:
+            recorded = { name: ( size, mtime, validated ) for ( name, size, mtime, validated ) in db.execute( "SELECT name, size, mtime, validated FROM files WHERE location = ?", ( location, ) ) }
+            removed = [ ( location, name ) for name in recorded if name not in scanned ]
+            changed = [ ( location, name, size, mtime ) for name, ( size, mtime ) in scanned.items() if recorded.get( name, (None,None,None) )[:2] != ( size, mtime ) ]
+            db.executemany( "DELETE FROM files WHERE location = ? AND name = ?", removed )
+            db.executemany( "INSERT OR REPLACE INTO files ( location, name, size, mtime, validated ) VALUES ( ?, ?, ?, ?, NULL )", changed )
+        changed_names = { item[1] for item in changed }
+        return { name: ( None if name in changed_names else recorded[name][2] ) for name in scanned }
+
+    def set_validated( self, location: str, name: str, validated: bool ):
+        with self.connect() as db:
+            db.execute( "UPDATE files SET validated = ? WHERE location = ? AND name = ?", ( int(validated), location, name ) )
+
+    def files( self, location: str ) -> List[str]:
+        with self.connect() as db:
+            return [ row[0] for row in db.execute( "SELECT name FROM files WHERE location = ? ORDER BY name", ( location, ) ) ]
@@ -1,5 +1,5 @@
-import time, os, wget, sys, pprint
-from typing import List, Union, Dict
+import time, os, sys, pprint
+from typing import List, Union, Dict, Optional
 import numpy as np
 from multiprocessing import Pool
 from geoproc.xext.xgeo import XGeo
@@ -13,6 +13,19 @@ class MWPDataManager(ConfigurableObject):
         ConfigurableObject.__init__( self, **kwargs )
         self.data_dir = data_dir
         self.data_source_url = data_source_url
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        from geoproc.data.manifest import TileManifest
+        if self._manifest is None: self._manifest = TileManifest( self.data_dir )
+        return self._manifest
+
+    def get_existing_files( self, location: str, **kwargs ) -> Dict[str,Optional[int]]:
+        """ Returns { file name: validated flag } for the files in the location directory, from one manifest refresh (a single directory scan) """
+        if self.getParameter( "manifest", True, **kwargs ): return self.manifest.refresh( location )
+        location_dir = self.get_location_dir( location )
+        return { name: None for name in os.listdir( location_dir ) }
 
     def get_location_dir( self, location: str ) -> str:
         loc_dir = os.path.join( self.data_dir, location )
@@ -44,24 +57,34 @@ class MWPDataManager(ConfigurableObject):
         year =      self.getParameter("year", **kwargs)
         product =   self.getParameter( "product",   **kwargs )
         location_dir = self.get_location_dir( location )
-        files = []
+        downloader = self.get_downloader( **kwargs )
+        existing_files = self.get_existing_files( location, **kwargs )
+        use_manifest = self.getParameter( "manifest", True, **kwargs )
+        targets = []
         if years is None: years = year
         iYs = years if isinstance(years, list) else [years]
         for iY in iYs:
             for iFile in range(start_day+1,end_day+1):
                 target_file = f"MWP_{iY}{iFile:03}_{location}_{product}.tif"
                 target_file_path = os.path.join( location_dir, target_file )
-                if self.test_if_damaged( target_file_path ):
-                    target_url = self.data_source_url + f"/{location}/{iY}/{target_file}"
-                    try:
-                        wget.download( target_url, target_file_path )
-                        print(f"Downloading url {target_url} to file {target_file_path}")
-                        files.append( target_file_path )
-                    except Exception:
-                        print( f"     ---> Can't access {target_url}")
-                else:
-                    print(f" Array[{len(files)}] -> Time[{iFile}]: {target_file_path}")
+                validated = existing_files.get( target_file, 0 )
+                if validated is None:
+                    validated = not self.test_if_damaged( target_file_path )
+                    if use_manifest: self.manifest.set_validated( location, target_file, validated )
+                targets.append( ( iFile, self.data_source_url + f"/{location}/{iY}/{target_file}", target_file_path, validated ) )
+        replacements = [ ( target_url, target_file_path ) for ( iFile, target_url, target_file_path, validated ) in targets if not validated ]
+        downloaded = dict( zip( replacements, downloader.fetch_all( replacements ) ) )
+        files = []
+        for ( iFile, target_url, target_file_path, validated ) in targets:
+            if not validated:
+                if downloaded[ ( target_url, target_file_path ) ]:
+                    print(f"Downloaded url {target_url} to file {target_file_path}")
                     files.append( target_file_path )
+                else:
+                    print( f"     ---> Can't access {target_url}")
+            else:
+                print(f" Array[{len(files)}] -> Time[{iFile}]: {target_file_path}")
+                files.append( target_file_path )
         print(" Downloaded replacement files:")
         pp( files )
         return files
@@ -70,28 +93,35 @@ class MWPDataManager(ConfigurableObject):
         download =  self.getParameter( "download",  **kwargs )
         start_day = self.getParameter( "start_day", **kwargs )
         end_day =   self.getParameter( "end_day",   **kwargs )
-        years =     self.getParameter( "years",   [ self.getParameter("year", **kwargs) ] )
+        years =     self.getParameter( "years",   [ self.getParameter("year", **kwargs) ], **kwargs )
         product =   self.getParameter( "product",   **kwargs )
         location_dir = self.get_location_dir( location )
-        files = []
+        targets = []
         for iY in list(years):
             for iFile in range(start_day+1,end_day+1):
                 target_file = f"MWP_{iY}{iFile:03}_{location}_{product}.tif"
-                target_file_path = os.path.join( location_dir, target_file )
-                if not os.path.exists( target_file_path ):
-                    if download:
-                        target_url = self.data_source_url + f"/{location}/{iY}/{target_file}"
-                        try:
-                            wget.download( target_url, target_file_path )
-                            print(f"Downloading url {target_url} to file {target_file_path}")
-                            files.append( target_file_path )
-                        except Exception:
-                            print( f"     ---> Can't access {target_url}")
-                else:
-                    print(f" Array[{len(files)}] -> Time[{iFile}]: {target_file_path}")
+                targets.append( ( iFile, self.data_source_url + f"/{location}/{iY}/{target_file}", os.path.join( location_dir, target_file ) ) )
+        existing_files = self.get_existing_files( location, **kwargs )
+        missing = [ ( target_url, target_file_path ) for ( iFile, target_url, target_file_path ) in targets if os.path.basename( target_file_path ) not in existing_files ] if download else []
+        downloaded = dict( zip( missing, self.get_downloader( **kwargs ).fetch_all( missing ) ) )
+        files = []
+        for ( iFile, target_url, target_file_path ) in targets:
+            if ( target_url, target_file_path ) in downloaded:
+                if downloaded[ ( target_url, target_file_path ) ]:
+                    print(f"Downloaded url {target_url} to file {target_file_path}")
                     files.append( target_file_path )
+                else:
+                    print( f"     ---> Can't access {target_url}")
+            elif os.path.basename( target_file_path ) in existing_files:
+                print(f" Array[{len(files)}] -> Time[{iFile}]: {target_file_path}")
+                files.append( target_file_path )
         return files
 
+    def get_downloader( self, **kwargs ):
+        from geoproc.data.downloader import TileDownloader
+        return TileDownloader( max_workers = self.getParameter( "max_downloads", 8, **kwargs ), max_per_host = self.getParameter( "max_host_connections", 4, **kwargs ),
+                               retries = self.getParameter( "download_retries", 4, **kwargs ) )
+
 #   https: // floodmap.modaps.eosdis.nasa.gov / Products / 120W050N / 2020 / MWP_2020051_120W050N_3D3OT.tif
 
     def get_array_data(self, files: List[str], merge=False ) ->  Union[xr.DataArray,List[xr.DataArray]]:
@@ -118,9 +148,9 @@ class MWPDataManager(ConfigurableObject):
         return global_locs
 
     def remove_empty_directories(self, nProcesses: int = 8):
-        locations = dataMgr.get_global_locations()
+        locations = self.get_global_locations()
         with Pool(nProcesses) as p:
-            p.map(dataMgr.delete_if_empty, locations, nProcesses)
+            p.map(self.delete_if_empty, locations, nProcesses)
 
     def _segment(self, strList: List[str], nSegments ):
         seg_length = int( round( len( strList )/nSegments ) )
@@ -128,9 +158,9 @@ class MWPDataManager(ConfigurableObject):
 
     def download_tiles(self, nProcesses: int = 8 ):
         location = self.parms.get( 'location' )
-        locations = dataMgr.get_global_locations( ) if location is None else [ location ]
-        with Pool(nProcesses) as p:
-            p.map(dataMgr.get_tile, locations, nProcesses)
+        locations = self.get_global_locations( ) if location is None else [ location ]
+        for location in locations:
+            self.get_tile( location, max_downloads=nProcesses )
 
 if __name__ == '__main__':
     if len(sys.argv) == 1:
@@ -73,8 +73,11 @@ class ShapefileManager(ConfigurableObject):
         return poly, regionmask.Regions_cls( poly_name, [0], [poly_name], [poly_name], [poly] )
 
     def crop(self, image: xa.DataArray, regions: Regions_cls ) -> xa.DataArray:
-        region_mask = regions.mask( image, lat_name=image.dims[-2], lon_name=image.dims[-1] )
-        return image.where( region_mask == 0 )
+        from geoproc.util.masks import MaskCache
+        lat_name, lon_name = image.dims[-2], image.dims[-1]
+        key = MaskCache.key( regions.polygons, list(regions.numbers), image.coords[lat_name].values, image.coords[lon_name].values )
+        mask_entry = MaskCache.get( key, lambda: ( regions.mask( image, lat_name=lat_name, lon_name=lon_name ) == 0 ).values )
+        return image.where( xa.DataArray( MaskCache.full_mask( mask_entry ), dims=[ lat_name, lon_name ] ) )
 
     def extractTile(self, gdFrame: gpd.GeoDataFrame, location: str, size: int = 10) -> LinearRing:
         origin: Point = self.parseLocation(location)
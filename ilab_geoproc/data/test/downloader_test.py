@@ -0,0 +1,126 @@
+import os, time, tempfile, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict, Optional
+from geoproc.data.downloader import TileDownloader
+
+CONTENT = os.urandom( 100000 )
+
+class LocalServer:
+    """  Local HTTP server serving CONTENT with Range support.  /missing* return 404, /flaky fails with 503 twice,
+         /truncated drops its first transfer halfway, and /slow* requests record the peak number of concurrent requests. """
+
+    def __init__( self ):
+        self.requests: Dict[str,List[Optional[str]]] = {}
+        self.active, self.max_active = 0, 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer( ( "127.0.0.1", 0 ), self.handler() )
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread( target=self.server.serve_forever, daemon=True ).start()
+
+    def handler( self ):
+        test_server = self
+
+        class Handler( BaseHTTPRequestHandler ):
+
+            def do_GET( self ):
+                with test_server.lock:
+                    seen = test_server.requests.setdefault( self.path, [] )
+                    seen.append( self.headers.get( 'Range' ) )
+                if self.path.startswith( "/missing" ): return self.send_error( 404 )
+                if ( self.path == "/flaky" ) and ( len( seen ) <= 2 ): return self.send_error( 503 )
+                if self.path.startswith( "/slow" ):
+                    with test_server.lock:
+                        test_server.active += 1
+                        test_server.max_active = max( test_server.max_active, test_server.active )
+                    time.sleep( 0.2 )
+                    with test_server.lock: test_server.active -= 1
+                offset = int( seen[-1].split("=")[1].split("-")[0] ) if seen[-1] else 0
+                if offset >= len( CONTENT ): return self.send_error( 416 )
+                self.send_response( 206 if offset > 0 else 200 )
+                self.send_header( 'Content-Length', str( len( CONTENT ) - offset ) )
+                self.end_headers()
+                if ( self.path == "/truncated" ) and ( len( seen ) == 1 ):
+                    self.wfile.write( CONTENT[ offset:len( CONTENT )//2 ] )
+                    self.close_connection = True
+                else:
+                    self.wfile.write( CONTENT[offset:] )
+
+            def log_message( self, *args ): pass
+
+        return Handler
+
+    def shutdown( self ):
+        self.server.shutdown()
+        self.server.server_close()
+
+def get_downloader( **kwargs ) -> TileDownloader:
+    return TileDownloader( **dict( dict( max_workers=8, max_per_host=2, retries=3, backoff=0.01, timeout=10.0, chunk_size=4096 ), **kwargs ) )
+
+def read( file_path: str ) -> bytes:
+    with open( file_path, "rb" ) as test_file: return test_file.read()
+
+def test_resume():
+    server = LocalServer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join( tmp_dir, "resume" )
+        with open( file_path + ".part", "wb" ) as part_file: part_file.write( CONTENT[:30000] )
+        assert get_downloader().fetch( f"{server.url}/resume", file_path )
+        assert read( file_path ) == CONTENT and not os.path.exists( file_path + ".part" )
+        assert server.requests["/resume"] == [ "bytes=30000-" ]
+    server.shutdown()
+
+def test_complete_part_file():
+    """ A .part file that already holds the whole file gets a 416 response, which completes the transfer """
+    server = LocalServer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join( tmp_dir, "done" )
+        with open( file_path + ".part", "wb" ) as part_file: part_file.write( CONTENT )
+        assert get_downloader().fetch( f"{server.url}/done", file_path ) and read( file_path ) == CONTENT
+    server.shutdown()
+
+def test_retries():
+    server = LocalServer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assert get_downloader().fetch( f"{server.url}/flaky", os.path.join( tmp_dir, "flaky" ) )
+        assert read( os.path.join( tmp_dir, "flaky" ) ) == CONTENT and len( server.requests["/flaky"] ) == 3
+        assert get_downloader().fetch( f"{server.url}/truncated", os.path.join( tmp_dir, "truncated" ) )
+        assert read( os.path.join( tmp_dir, "truncated" ) ) == CONTENT
+        assert ( len( server.requests["/truncated"] ) == 2 ) and ( server.requests["/truncated"][1] is not None ), "interrupted transfer not resumed"
+    server.shutdown()
+
+def test_missing():
+    server = LocalServer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join( tmp_dir, "missing" )
+        assert not get_downloader().fetch( f"{server.url}/missing", file_path )
+        assert len( server.requests["/missing"] ) == 1, "missing file retried"
+        assert not os.path.exists( file_path )
+    server.shutdown()
+
+def test_per_host_limit():
+    server = LocalServer()
+    downloader = get_downloader()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs = [ ( f"{server.url}/slow{iJ}", os.path.join( tmp_dir, f"slow{iJ}" ) ) for iJ in range( 8 ) ] + [ ( f"{server.url}/missing0", os.path.join( tmp_dir, "missing0" ) ) ]
+        assert downloader.fetch_all( jobs ) == [ True ] * 8 + [ False ]
+    assert 1 < server.max_active <= downloader.max_per_host
+    server.shutdown()
+
+def test_reload_damaged_files():
+    """ MWPDataManager.reload_damaged_files replaces damaged and missing files through TileDownloader.fetch_all """
+    from geoproc.data.mwp import MWPDataManager
+    server = LocalServer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataMgr = MWPDataManager( tmp_dir, f"{server.url}/tiles" )
+        dataMgr.setDefaults( product="2D2OT", years=[2019], start_day=0, end_day=3, manifest=False, max_host_connections=2 )
+        location_dir = dataMgr.get_location_dir( "120W050N" )
+        with open( os.path.join( location_dir, "MWP_2019001_120W050N_2D2OT.tif" ), "wb" ) as damaged_file: damaged_file.write( b"damaged" )
+        files = dataMgr.reload_damaged_files( "120W050N" )
+        assert len( files ) == 3 and all( read( file_path ) == CONTENT for file_path in files )
+        assert sorted( server.requests ) == [ f"/tiles/120W050N/2019/MWP_2019{iD:03d}_120W050N_2D2OT.tif" for iD in range( 1, 4 ) ]
+    server.shutdown()
+
+if __name__ == '__main__':
+    for test in [ test_resume, test_complete_part_file, test_retries, test_missing, test_per_host_limit, test_reload_damaged_files ]:
+        test()
+        print( f"{test.__name__}: passed" )
@@ -0,0 +1,94 @@
+import os, hashlib, json
+import numpy as np
+import xarray as xr
+from typing import List, Union, Tuple, Dict, Optional
+
+class TileCache:
+    """  Persistent on-disk cache of cropped MWP tile stacks, one compressed NetCDF file per (location, product, year, roi) key.
+         Each entry records the name, size and mtime of its input files, so that an entry is refreshed when files are added or replaced.
+         Entries are evicted least-recently-used first (by file mtime, refreshed on each hit) once the cache exceeds max_size_gb. """
+
+    def __init__( self, cache_dir: str, max_size_gb: float = None, complevel: int = 4 ):
+        self.cache_dir = cache_dir
+        self.max_size = None if max_size_gb is None else float(max_size_gb) * 1.0e9
+        self.complevel = complevel
+        os.makedirs( self.cache_dir, exist_ok=True )
+
+    @classmethod
+    def roi_signature( cls, roi ) -> str:
+        if roi is None: return "none"
+        if isinstance( roi, (list, tuple, np.ndarray) ):
+            return json.dumps( [ round( float(x), 6 ) for x in roi ] )
+        geometry_hash = hashlib.sha1( b"".join( geom.wkb for geom in roi.geometry ) ).hexdigest()
+        return f"{roi.crs}:{geometry_hash}"
+
+    def key( self, location: str, product: str, year: int, roi, **kwargs ) -> str:
+        spec = dict( location=location, product=product, year=int(year), roi=self.roi_signature(roi), **kwargs )
+        digest = hashlib.sha1( json.dumps( spec, sort_keys=True, default=str ).encode() ).hexdigest()[:16]
+        return f"MWP_{location}_{product}_{int(year)}_{digest}"
+
+    def file_path( self, key: str ) -> str:
+        return os.path.join( self.cache_dir, key + ".nc" )
+
+    @classmethod
+    def file_signature( cls, file_paths: List[str] ) -> Dict[str,List]:
+        """ { file name: [ size, mtime ] } for the input files of a stack """
+        signature = {}
+        for path in file_paths:
+            stat = os.stat( path )
+            signature[ os.path.basename( path ) ] = [ stat.st_size, stat.st_mtime ]
+        return signature
+
+    @classmethod
+    def file_day( cls, file_name: str ) -> int:
+        """ Day of year of an MWP file name, MWP_{year}{day}_{location}_{product}.tif """
+        return int( file_name.split("_")[1][4:] )
+
+    def get( self, key: str, day_range: Tuple[int,int], file_paths: Optional[List[str]] = None ) -> Optional[xr.DataArray]:
+        """ Returns the cached stack restricted to days (day_range[0], day_range[1]], or None if the entry does not cover that range or,
+            when file_paths is given, if the entry was built from a different set or version of the input files in that range """
+        file_path = self.file_path( key )
+        if not os.path.isfile( file_path ): return None
+        try:
+            with xr.open_dataset( file_path ) as dset:
+                if ( dset.attrs['start_day'] > day_range[0] ) or ( dset.attrs['end_day'] < day_range[1] ): return None
+                if ( file_paths is not None ) and not self.matches( json.loads( dset.attrs.get( 'files', 'null' ) ), file_paths, day_range ): return None
+                tile: xr.DataArray = dset.tile.load()
+        except Exception as err:
+            print( f"Ignoring unreadable tile cache entry {file_path}: {err}" )
+            return None
+        os.utime( file_path )
+        days = tile.coords['time'].dt.dayofyear.values
+        return tile.isel( time = ( days > day_range[0] ) & ( days <= day_range[1] ) )
+
+    def matches( self, cached_files: Optional[Dict[str,List]], file_paths: List[str], day_range: Tuple[int,int] ) -> bool:
+        if cached_files is None: return False
+        in_range = { name: signature for name, signature in cached_files.items() if day_range[0] < self.file_day( name ) <= day_range[1] }
+        return in_range == self.file_signature( file_paths )
+
+    def put( self, key: str, day_range: Tuple[int,int], tile: xr.DataArray, file_paths: Optional[List[str]] = None ):
+        file_path = self.file_path( key )
+        coords = { dim: tile.coords[dim].values for dim in tile.dims }
+        attrs = dict( start_day=int(day_range[0]), end_day=int(day_range[1]) )
+        if file_paths is not None: attrs['files'] = json.dumps( self.file_signature( file_paths ) )
+        dset = xr.Dataset( dict( tile = xr.DataArray( tile.values, dims=tile.dims, coords=coords ) ), attrs=attrs )
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        dset.to_netcdf( tmp_file_path, encoding = dict( tile = dict( zlib=True, complevel=self.complevel ) ) )
+        os.replace( tmp_file_path, file_path )
+        self.evict()
+
+    def evict( self ):
+        if self.max_size is None: return
+        entries = []
+        for entry in os.scandir( self.cache_dir ):
+            if entry.is_file() and entry.name.endswith(".nc"):
+                stat = entry.stat()
+                entries.append( ( stat.st_mtime, stat.st_size, entry.path ) )
+        total_size = sum( entry[1] for entry in entries )
+        for ( mtime, size, path ) in sorted( entries ):
+            if total_size <= self.max_size: break
+            try:
+                os.remove( path )
+                total_size = total_size - size
+                print( f"Evicted tile cache entry {path}" )
+            except OSError: pass
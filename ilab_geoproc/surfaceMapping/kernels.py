@@ -0,0 +1,113 @@
+import numpy as np
+from typing import List, Union, Tuple, Dict, Optional
+
+class WaterMapKernels:
+    """  Vectorized numpy kernels operating directly on MWP class cubes (time, y, x) """
+
+    LAND_CLASSES = [ 1 ]
+    WATER_CLASSES = [ 2, 3 ]
+
+    @classmethod
+    def as_class_array( cls, data: np.ndarray, nodata: int = 0 ) -> np.ndarray:
+        if np.issubdtype( data.dtype, np.integer ): return data
+        return np.where( np.isfinite(data), data, nodata ).astype( np.uint8 )
+
+    @classmethod
+    def count_lut( cls, max_count: int ) -> Tuple[np.ndarray,int]:
+        """ Returns a lookup table packing (land, water) increments into a single integer, and the packing shift """
+        dtype, shift = ( np.uint16, 8 ) if max_count < 256 else ( np.uint32, 16 ) if max_count < 65536 else ( np.uint64, 32 )
+        lut = np.zeros( [256], dtype=dtype )
+        lut[ cls.LAND_CLASSES ] = 1
+        lut[ cls.WATER_CLASSES ] = 1 << shift
+        return lut, shift
+
+    @classmethod
+    def bin_class_counts( cls, data: np.ndarray, bin_starts: np.ndarray ) -> Tuple[np.ndarray,np.ndarray]:
+        """ Single pass over a (time, y, x) class cube returning (land, water) counts per time bin: bin i covers [bin_starts[i], bin_starts[i+1]) """
+        bin_starts = np.asarray( bin_starts, dtype=np.intp )
+        bin_ends = np.append( bin_starts[1:], data.shape[0] )
+        lut, shift = cls.count_lut( int( np.max( bin_ends - bin_starts, initial=0 ) ) )
+        packed: np.ndarray = np.add.reduceat( lut[ cls.as_class_array(data) ], np.minimum( bin_starts, data.shape[0]-1 ), axis=0, dtype=lut.dtype )
+        packed[ bin_ends <= bin_starts ] = 0
+        land = ( packed & ( ( 1 << shift ) - 1 ) ).astype( np.uint16 )
+        water = ( packed >> shift ).astype( np.uint16 )
+        return land, water
+
+    @classmethod
+    def water_maps( cls, data: np.ndarray, bin_starts: np.ndarray, threshold: float, mask_value: int ) -> Tuple[np.ndarray,np.ndarray]:
+        """ Computes (water_maps, reliability) for all time bins at once, matching WaterMapGenerator.get_water_map """
+        bin_starts = np.asarray( bin_starts, dtype=np.intp )
+        bin_sizes = np.append( bin_starts[1:], data.shape[0] ) - bin_starts
+        land, water = cls.bin_class_counts( data, bin_starts )
+        visible = land + water
+        masked = data[ np.minimum( bin_starts, data.shape[0]-1 ) ] == mask_value
+        with np.errstate( divide='ignore', invalid='ignore' ):
+            water_mask = ( water / visible ) >= threshold
+            reliability = visible / bin_sizes.reshape( [-1] + [1] * ( data.ndim - 1 ) ).astype( np.float64 )
+        result = np.where( masked, mask_value, np.where( water_mask, 2, np.where( land > 0, 1, 0 ) ) ).astype( np.uint8 )
+        return result, reliability
+
+    @classmethod
+    def class_counts( cls, data: np.ndarray, block_pixels: int = 1 << 24 ) -> np.ndarray:
+        """ Pixel counts of every class value for each time step of a (time, y, x) class cube, shape (time, max class + 1).
+            Each block of time steps is counted with a single bincount over class values offset by time index. """
+        classes: np.ndarray = cls.as_class_array( data ).reshape( data.shape[0], -1 )
+        nclasses = int( classes.max( initial=0 ) ) + 1
+        block_size = max( 1, block_pixels // max( classes.shape[1], 1 ) )
+        counts = np.empty( [ data.shape[0], nclasses ], dtype=np.int64 )
+        for iT0 in range( 0, data.shape[0], block_size ):
+            block = classes[ iT0:iT0+block_size ]
+            offsets = np.arange( block.shape[0], dtype=np.int64 ).reshape( -1, 1 ) * nclasses
+            counts[ iT0:iT0+block.shape[0] ] = np.bincount( ( block + offsets ).ravel(), minlength=block.shape[0]*nclasses ).reshape( -1, nclasses )
+        return counts
+
+    @classmethod
+    def fill_gaps( cls, data: np.ndarray, gap_value: int, nodata_value: int = 0 ) -> np.ndarray:
+        """ In-place temporal gap fill along axis 0 of an integer class cube: cells equal to gap_value take the most recent preceding
+            valid class (neither gap_value nor nodata_value), or failing that the first following one.  Cells with no valid class are left as gap_value. """
+        fill_kernel = cls.get_fill_kernel()
+        if ( fill_kernel is not None ) and data.flags.c_contiguous:
+            fill_kernel( data.reshape( data.shape[0], -1 ), gap_value, nodata_value )
+            return data
+        gaps = ( data == gap_value )
+        valid = ~gaps & ( data != nodata_value )
+        index_dtype = np.int16 if data.shape[0] < np.iinfo(np.int16).max else np.int32
+        tindex = np.arange( data.shape[0], dtype=index_dtype ).reshape( [-1] + [1] * ( data.ndim - 1 ) )
+        last_valid = np.where( valid, tindex, 0 ).astype( index_dtype )
+        np.maximum.accumulate( last_valid, axis=0, out=last_valid )
+        has_prev = np.logical_or.accumulate( valid, axis=0 )
+        ffill = gaps & has_prev
+        data[ ffill ] = np.take_along_axis( data, last_valid, axis=0 )[ ffill ]
+        del last_valid
+        first_valid = np.argmax( valid, axis=0 )[np.newaxis]
+        bfill = gaps & ~has_prev & valid.any( axis=0 )
+        data[ bfill ] = np.broadcast_to( np.take_along_axis( data, first_valid, axis=0 ), data.shape )[ bfill ]
+        return data
+
+    _fill_kernel = None
+
+    @classmethod
+    def get_fill_kernel( cls ):
+        if cls._fill_kernel is None:
+            try: import numba
+            except ImportError: return None
+
+            @numba.njit( nogil=True )
+            def fill_kernel( data: np.ndarray, gap_value: int, nodata_value: int ):
+                last = np.full( data.shape[1], gap_value, data.dtype )
+                for iT in range( data.shape[0] ):
+                    for iP in range( data.shape[1] ):
+                        value = data[ iT, iP ]
+                        if value == gap_value:
+                            if last[iP] != gap_value: data[ iT, iP ] = last[iP]
+                        elif value != nodata_value: last[iP] = value
+                last[:] = gap_value
+                for iT in range( data.shape[0]-1, -1, -1 ):
+                    for iP in range( data.shape[1] ):
+                        value = data[ iT, iP ]
+                        if value == gap_value:
+                            if last[iP] != gap_value: data[ iT, iP ] = last[iP]
+                        elif value != nodata_value: last[iP] = value
+
+            cls._fill_kernel = fill_kernel
+        return cls._fill_kernel
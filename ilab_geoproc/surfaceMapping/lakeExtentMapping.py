@@ -23,6 +23,9 @@ class WaterMapGenerator(ConfigurableObject):
         self.yearly_lake_masks: xr.DataArray = None
         self.roi_bounds: gpd.GeoSeries = None
         self.mask_value = 5
+        self.gap_value = 255
+        self._stage_results: Dict[str,Tuple[str,object]] = {}
+        self._regridders: Dict[str,object] = {}
 
     def get_water_map_colors(self) -> List[Tuple]:
         return [(0, 'nodata', (0, 0, 0)),
@@ -43,6 +46,55 @@ class WaterMapGenerator(ConfigurableObject):
         from datetime import datetime
         return np.datetime64( datetime(year, 7, 1) )
 
+    def get_class_dtype( self, opspec: Dict ) -> Optional[np.dtype]:
+        """ Returns the compact integer dtype configured for MWP class data (source.dtype), or None if classes are carried as floats """
+        dtype = np.dtype( opspec.get( 'source', {} ).get( 'dtype', 'f4' ) )
+        return dtype if np.issubdtype( dtype, np.integer ) else None
+
+    def get_product_cache( self, opspec: Dict ):
+        from geoproc.surfaceMapping.product_cache import ProductCache
+        return ProductCache( **opspec.get( 'product_cache', {} ) )
+
+    def get_product_fingerprint( self, opspec: Dict, product: str, **kwargs ) -> str:
+        from geoproc.surfaceMapping.product_cache import ProductCache
+        from geoproc.surfaceMapping.stages import StageGraph
+        if product == "water_counts":
+            inputs = { key: value for key, value in self.get_stage_inputs( opspec, "water_mapping_data" ).items() if key not in [ 'year_range', 'day_range' ] }
+            return ProductCache.fingerprint( dict( inputs, **self.get_stage_inputs( opspec, "water_maps" ) ) )
+        return StageGraph( self, opspec, **kwargs ).fingerprint( product )
+
+    def get_stage_inputs( self, opspec: Dict, stage: str, **kwargs ) -> Dict:
+        """ The opspec inputs (and roi) of a single pipeline stage; the inputs of upstream stages enter through their fingerprints (see StageGraph) """
+        from geoproc.data.tile_cache import TileCache
+        lake_index = opspec.get('lake_index', opspec.get('index'))
+        if stage == "yearly_lake_masks":
+            return dict( lake_index = lake_index, mask_value = self.mask_value, id = opspec.get('id'), data_dir = opspec.get('data_dir'), water_masks = opspec.get('water_masks') )
+        if stage == "water_mapping_data":
+            return dict( lake_index = lake_index, mask_value = self.mask_value, roi = TileCache.roi_signature( self.roi_bounds ),
+                         source = { key: opspec.get('source',{}).get(key) for key in [ 'url', 'product', 'location', 'dtype' ] },
+                         year_range = opspec.get('year_range'), day_range = opspec.get('day_range',[0,365]) )
+        if stage == "water_maps":
+            return dict( water_maps = { key: opspec.get('water_maps',{}).get(key) for key in [ 'threshold', 'bin_size' ] } )
+        if stage == "water_probability":
+            return dict( yearly = ( 'water_masks' in opspec ) )
+        if stage == "persistent_classes":
+            return dict( water_class_thresholds = opspec.get('water_class_thresholds', [ 0.05, 0.95 ] ) )
+        if stage == "patched_water_maps":
+            return dict( highlight = kwargs.get( "highlight", True ), ffill = kwargs.get( "ffill", True ), dynamics_class = kwargs.get( "dynamics_class", 0 ) )
+        raise Exception( f"Unrecognized pipeline stage: {stage}" )
+
+    def get_product_file( self, opspec: Dict, product: str ) -> Optional[str]:
+        if product == "yearly_lake_masks":
+            if opspec.get('water_masks') is None: return None
+            return os.path.join( opspec.get('data_dir'), f"Lake{opspec.get('id')}_fill_masks.nc" )
+        if product in [ "water_maps", "water_probability", "water_counts" ]:
+            return os.path.join( opspec.get('results_dir'), f"lake_{opspec['lake_index']}_{product}.nc" )
+        raise Exception( f"Product {product} is not stored in the product cache" )
+
+    def get_stage_graph( self, opspec: Dict, **kwargs ):
+        from geoproc.surfaceMapping.stages import StageGraph
+        return StageGraph( self, opspec, **kwargs )
+
     def get_viable_file(self, fpaths: List[str] ) -> str:
         for fpath in fpaths:
             if os.path.isfile(fpath):
@@ -58,13 +110,14 @@ class WaterMapGenerator(ConfigurableObject):
         if wmask_opspec is None: return None
         lake_masks_dir: str = wmask_opspec.get('location', "" ).replace("{data_dir}",data_dir)
         lake_index = opspec.get('index')
-        lake_id = opspec.get('id' )
-        yearly_lake_masks_file = os.path.join(data_dir, f"Lake{lake_id}_fill_masks.nc")
+        yearly_lake_masks_file = self.get_product_file( opspec, "yearly_lake_masks" )
         cache = kwargs.get('cache',"update")
         lake_mask_nodata = int( wmask_opspec.get('nodata', 256) )
-        if cache==True and os.path.isfile( yearly_lake_masks_file ):
-            yearly_lake_masks_dataset: xr.Dataset = xr.open_dataset(yearly_lake_masks_file)
-            yearly_lake_masks: xr.DataArray = yearly_lake_masks_dataset.yearly_lake_masks
+        productCache = self.get_product_cache( opspec )
+        fingerprint = self.get_product_fingerprint( opspec, "yearly_lake_masks" )
+        cached_dataset: Optional[xr.Dataset] = productCache.read( yearly_lake_masks_file, fingerprint ) if cache==True else None
+        if cached_dataset is not None:
+            yearly_lake_masks: xr.DataArray = cached_dataset.yearly_lake_masks
         else:
              for sdir in glob( f"{lake_masks_dir}/*" ):
                 year = os.path.basename(sdir)
@@ -74,11 +127,8 @@ class WaterMapGenerator(ConfigurableObject):
              time_values = np.array([self.get_date_from_year(year) for year in sorted_file_paths.keys()], dtype='datetime64[ns]')
              yearly_lake_masks: xr.DataArray = XRio.load(list(sorted_file_paths.values()), band=0, mask_value=lake_mask_nodata, index=time_values)
              yearly_lake_masks = yearly_lake_masks.where( yearly_lake_masks != lake_mask_nodata, self.mask_value )
-
-        if cache in [ True, "update" ]:
-            result = xr.Dataset(dict(yearly_lake_masks=sanitize(yearly_lake_masks)))
-            result.to_netcdf(yearly_lake_masks_file)
-            print(f"Saved cropped_data to {yearly_lake_masks_file}")
+             if cache in [ True, "update" ]:
+                productCache.write( xr.Dataset( dict( yearly_lake_masks=yearly_lake_masks ) ), yearly_lake_masks_file, fingerprint, class_vars=['yearly_lake_masks'] )
 
         yearly_lake_masks = yearly_lake_masks.persist()
         print(f"Done yearly_lake_masks in time {time.time() - t0} secs")
@@ -96,12 +146,14 @@ class WaterMapGenerator(ConfigurableObject):
                             xr.where(perm_water_mask, 2,
                                      xr.where(perm_land_mask, 1, 0)))
         else:
-            yearly_lake_masks = self.yearly_lake_masks.interp_like(self.water_probability, method='nearest')
+            yearly_lake_masks = self.get_regridder( "yearly_lake_masks", self.yearly_lake_masks, self.water_probability ).apply( self.yearly_lake_masks )
             mask_value = yearly_lake_masks.attrs['mask']
             water_value = yearly_lake_masks.attrs['water']
             perm_land_mask: xr.DataArray = self.water_probability < thresholds[0]
             roi_mask: xr.DataArray = np.logical_or( ( yearly_lake_masks == mask_value ), boundaries_mask )
             result = xr.where( roi_mask, self.mask_value, xr.where(perm_water_mask, 2, xr.where(perm_land_mask, 1, 0)))
+        class_dtype = self.get_class_dtype( opspec )
+        if class_dtype is not None: result = result.fillna( self.mask_value ).astype( class_dtype )
         result = result.persist()
         result.name = "Persistent_Classes"
         print(f"Done get_persistent_classes in time {time.time() - t0}")
@@ -113,24 +165,23 @@ class WaterMapGenerator(ConfigurableObject):
         t0 = time.time()
         cache = kwargs.get( "cache", False )
         yearly = 'water_masks' in opspec
-        data_dir = opspec.get('results_dir')
-        lake_index = opspec['lake_index']
-        water_probability_file = os.path.join(data_dir, f"lake_{lake_index}_water_probability.nc")
+        water_probability_file = self.get_product_file( opspec, "water_probability" )
 
-        if cache==True and os.path.isfile( water_probability_file ):
-            water_probability_dataset: xr.Dataset = xr.open_dataset(water_probability_file)
-            water_probability: xr.DataArray = water_probability_dataset.water_probability
+        productCache = self.get_product_cache( opspec )
+        fingerprint = self.get_product_fingerprint( opspec, "water_probability" )
+        cached_dataset: Optional[xr.Dataset] = productCache.read( water_probability_file, fingerprint ) if cache==True else None
+        if cached_dataset is not None:
+            water_probability: xr.DataArray = cached_dataset.water_probability
         else:
-            water = self.water_maps.isin([2, 3])
-            land = self.water_maps.isin([1])
+            counts: xr.Dataset = self.get_water_counts( opspec, **kwargs )
             unmasked = (self.water_maps[0] != self.mask_value).drop_vars(self.water_maps.dims[0])
 
             if yearly:
-                water_cnts = water.groupby("time.year").sum()
-                land_cnts  = land.groupby("time.year").sum()
+                water_cnts = counts.water_cnts
+                land_cnts  = counts.land_cnts
             else:
-                water_cnts = water.sum(axis=0)
-                land_cnts = land.sum(axis=0)
+                water_cnts = counts.water_cnts.sum( dim="year" )
+                land_cnts = counts.land_cnts.sum( dim="year" )
             visible_cnts = (water_cnts + land_cnts)
             water_probability: xr.DataArray = water_cnts / visible_cnts
             water_probability = water_probability.where( unmasked, 1.01 )
@@ -138,14 +189,100 @@ class WaterMapGenerator(ConfigurableObject):
             if yearly:
                 time_values = np.array( [ np.datetime64( datetime( year, 7, 1 ) ) for year in water_probability.year.data ], dtype='datetime64[ns]' )
                 water_probability = water_probability.assign_coords( year=time_values ).rename( year='time' )
-            if cache in [True,"update"]:
-                result = xr.Dataset(dict(water_probability=sanitize(water_probability)))
-                result.to_netcdf(water_probability_file)
-                print(f"Saved water_probability to {water_probability_file}")
+            if cache in [True,"update","increment"]:
+                productCache.write( xr.Dataset( dict( water_probability=water_probability ) ), water_probability_file, fingerprint )
         water_probability = water_probability.persist()
         print(f"Done get_water_probability in time {time.time() - t0}")
         return water_probability
 
+    def get_water_counts( self, opspec: Dict, **kwargs ) -> xr.Dataset:
+        """ Per-year, per-pixel water and land counts of self.water_maps, persisted alongside the water probability cache together with
+            the list of input (MWP) times they include.  With cache="increment" the stored counters are reused, and only the water maps
+            computed from input times (given as input_times) that have not yet been counted are added in. """
+        cache = kwargs.get( "cache", False )
+        water_counts_file = self.get_product_file( opspec, "water_counts" )
+        bin_times: Optional[List[np.ndarray]] = self.get_bin_input_times( opspec, kwargs.get( 'input_times' ) )
+        new_bins = np.ones( self.water_maps.shape[0], dtype=bool )
+        counts: Optional[xr.Dataset] = None
+        counted_times = np.array( [], dtype='datetime64[ns]' )
+        productCache = self.get_product_cache( opspec )
+        fingerprint = self.get_product_fingerprint( opspec, "water_counts" )
+        cached_counts: Optional[xr.Dataset] = productCache.read( water_counts_file, fingerprint ) if cache == "increment" else None
+        if cached_counts is not None:
+            counts = cached_counts
+            sdims = self.water_maps.dims[1:]
+            if ( 'counted_times' not in counts ) or ( bin_times is None ):
+                print( f"Can't match the water maps to the inputs counted in {water_counts_file}, recomputing" )
+                counts = None
+            elif not all( counts.water_cnts.sizes.get(dim) == self.water_maps.sizes[dim] and np.allclose( counts[dim].values, self.water_maps[dim].values ) for dim in sdims ):
+                print( f"Water counts in {water_counts_file} do not match the water maps grid, recomputing" )
+                counts = None
+            else:
+                counted_times = counts.counted_times.values
+                counts = counts.drop_vars( 'counted_times' )
+                bins_counted = [ np.isin( times, counted_times ) for times in bin_times ]
+                if any( counted.any() and not counted.all() for counted in bins_counted ):
+                    print( f"Water map bins partially overlap the inputs counted in {water_counts_file}, recomputing" )
+                    counts, counted_times = None, counted_times[:0]
+                else:
+                    new_bins = np.array( [ not counted.any() for counted in bins_counted ], dtype=bool )
+                    print( f"Incrementing water counts ({counted_times.shape[0]} inputs counted) with {int(new_bins.sum())} new water maps" )
+        new_water_maps: xr.DataArray = self.water_maps.isel( { self.water_maps.dims[0]: new_bins } )
+        if new_water_maps.shape[0] > 0:
+            new_counts = xr.Dataset( dict( water_cnts = new_water_maps.isin([2, 3]).groupby("time.year").sum().astype( np.uint32 ),
+                                           land_cnts  = new_water_maps.isin([1]).groupby("time.year").sum().astype( np.uint32 ) ) )
+            if counts is None:
+                counts = new_counts
+            else:
+                years = np.union1d( counts.year.values, new_counts.year.values )
+                counts = counts.reindex( year=years, fill_value=0 ) + new_counts.reindex( year=years, fill_value=0 )
+        if counts is None: raise Exception( f"No water maps to count for lake {opspec.get('lake_index')}" )
+        if bin_times is not None:
+            new_times = [ times for times, new in zip( bin_times, new_bins ) if new ]
+            counted_times = np.unique( np.concatenate( [ counted_times ] + new_times ).astype( 'datetime64[ns]' ) )
+        if counted_times.shape[0] > 0:
+            counts = counts.assign( counted_times = xr.DataArray( counted_times, dims=['counted'] ) )
+        if cache in [True, "update", "increment"]:
+            productCache.write( counts, water_counts_file, fingerprint )
+        return counts.drop_vars( 'counted_times', errors='ignore' )
+
+    @classmethod
+    def get_bin_count( cls, opspec: Dict, ntimes: int ) -> int:
+        """ Number of complete water map bins ( see get_water_maps ) computed from ntimes input times """
+        bin_size = opspec.get( 'water_maps', {} ).get( 'bin_size', 8 )
+        bin_indices = list( range( 0, ntimes, bin_size ) )
+        return len( range( bin_size//2, bin_indices[-1], bin_size ) ) if bin_indices else 0
+
+    def get_bin_input_times( self, opspec: Dict, input_times: Optional[np.ndarray] ) -> Optional[List[np.ndarray]]:
+        """ The input times binned into each of self.water_maps (see get_water_maps), or None if unknown or inconsistent with the water maps """
+        if input_times is None: return None
+        input_times = np.asarray( input_times, dtype='datetime64[ns]' )
+        bin_size = opspec.get( 'water_maps', {} ).get( 'bin_size', 8 )
+        bin_indices = list( range( 0, input_times.shape[0], bin_size ) )
+        centroid_times = input_times[ list( range( bin_size//2, bin_indices[-1], bin_size ) ) ] if bin_indices else input_times[:0]
+        if not np.array_equal( centroid_times, self.water_maps.coords[ self.water_maps.dims[0] ].values.astype( 'datetime64[ns]' ) ): return None
+        return [ input_times[ bin_indices[iB]:bin_indices[iB+1] ] for iB in range( centroid_times.shape[0] ) ]
+
+    def get_counted_times( self, opspec: Dict ) -> Optional[np.ndarray]:
+        """ The input (MWP) times included in the cached water counts, or None if there are no valid cached counts """
+        cached_counts: Optional[xr.Dataset] = self.get_product_cache( opspec ).read( self.get_product_file( opspec, "water_counts" ), self.get_product_fingerprint( opspec, "water_counts" ), load=False )
+        if cached_counts is None: return None
+        with cached_counts:
+            return cached_counts.counted_times.values if 'counted_times' in cached_counts else None
+
+    @classmethod
+    def get_uncounted_mask( cls, times: np.ndarray, counted_times: Optional[np.ndarray] ) -> np.ndarray:
+        """ Selects the input times not yet included in the water counts.  If an uncounted time precedes the last counted one
+            (an input backfilled since the last run) all times are selected, so that the counts are rebuilt from the full record. """
+        times = np.asarray( times, dtype='datetime64[ns]' )
+        if ( counted_times is None ) or ( len( counted_times ) == 0 ): return np.ones( times.shape, dtype=bool )
+        counted_times = np.asarray( counted_times, dtype='datetime64[ns]' )
+        uncounted = ~np.isin( times, counted_times )
+        if np.any( times[uncounted] < counted_times.max() ):
+            print( "Found uncounted inputs earlier than the last counted time, recounting the full record" )
+            return np.ones( times.shape, dtype=bool )
+        return uncounted
+
     def get_water_map(self,  opspec: Dict, inputs: xr.DataArray )-> xr.Dataset:
         da: xr.DataArray = self.time_merge(inputs) if isinstance(inputs, list) else inputs
         threshold = opspec.get('threshold', 0.5 )
@@ -163,32 +300,48 @@ class WaterMapGenerator(ConfigurableObject):
     def get_water_maps( self, data_array: Optional[xr.DataArray], opspec: Dict, **kwargs ) -> xr.DataArray:
         print("\n Executing get_water_maps ")
         t0 = time.time()
-        data_dir = opspec.get('results_dir')
-        lake_index = opspec['lake_index']
-        water_maps_file = os.path.join(data_dir, f"lake_{lake_index}_water_maps.nc")
+        water_maps_file = self.get_product_file( opspec, "water_maps" )
         cache = kwargs.get( "cache", False )
-        if cache==True and os.path.isfile( water_maps_file ):
-            water_maps_dset: xr.Dataset = xr.open_dataset(water_maps_file)
-        else:
+        productCache = self.get_product_cache( opspec )
+        fingerprint = None if data_array is None else self.get_product_fingerprint( opspec, "water_maps" )
+        water_maps_dset: Optional[xr.Dataset] = productCache.read( water_maps_file, fingerprint ) if cache==True else None
+        if water_maps_dset is None:
             time_axis = kwargs.get("time", data_array.coords[data_array.dims[0]].values)
             water_maps_opspec = opspec.get('water_maps',{})
             binSize = water_maps_opspec.get( 'bin_size', 8 )
             bin_indices = list(range( 0, time_axis.shape[0], binSize ))
             centroid_indices = list(range(binSize//2, bin_indices[-1], binSize))
             time_bins = np.array( [ time_axis[iT] for iT in bin_indices ], dtype='datetime64[ns]' )
-            print( f"get_water_maps: data_array.shape={data_array.shape},  data_array.dims={data_array.dims},  time_bins.shape={time_bins.shape}")
-            grouped_data: DatasetGroupBy = data_array.groupby_bins( data_array.dims[0], time_bins, right = False )
-            get_water_map_partial = functools.partial( self.get_water_map, water_maps_opspec )
-            water_maps_dset:  xr.Dataset = grouped_data.map( get_water_map_partial )
-            water_maps_dset = water_maps_dset.assign( time_bins = [ time_axis[i] for i in centroid_indices ]  ).rename( time_bins='time' ).persist()
+            engine = kwargs.get( "engine", water_maps_opspec.get( 'engine', 'xarray' ) )
+            print( f"get_water_maps: data_array.shape={data_array.shape},  data_array.dims={data_array.dims},  time_bins.shape={time_bins.shape}, engine={engine}")
+            if engine == "kernel":
+                water_maps_dset: xr.Dataset = self.get_water_maps_kernel( data_array, water_maps_opspec, time_bins, [ time_axis[i] for i in centroid_indices ] )
+            elif engine == "xarray":
+                grouped_data: DatasetGroupBy = data_array.groupby_bins( data_array.dims[0], time_bins, right = False )
+                get_water_map_partial = functools.partial( self.get_water_map, water_maps_opspec )
+                water_maps_dset:  xr.Dataset = grouped_data.map( get_water_map_partial )
+                water_maps_dset = water_maps_dset.assign( time_bins = [ time_axis[i] for i in centroid_indices ]  ).rename( time_bins='time' ).persist()
+            else:
+                raise Exception( f"Unrecognized water maps engine: {engine}")
+            if np.issubdtype( data_array.dtype, np.integer ):
+                water_maps_dset['water_maps'] = water_maps_dset.water_maps.astype( data_array.dtype )
             if cache in [True,"update"]:
-                water_maps_dset.to_netcdf(water_maps_file)
-                print(f"Cached water_maps to {water_maps_file}")
+                productCache.write( water_maps_dset, water_maps_file, fingerprint, class_vars=['water_maps'] )
         print( f" Completed get_water_maps in {time.time()-t0:.3f} seconds" )
         water_maps_array: xr.DataArray = water_maps_dset.water_maps
         water_maps_array.name = "Water_Maps"
         return water_maps_array.assign_attrs( cmap = dict( colors=self.get_water_map_colors() ) )
 
+    def get_water_maps_kernel( self, data_array: xr.DataArray, opspec: Dict, time_bins: np.ndarray, centroid_times: List ) -> xr.Dataset:
+        from geoproc.surfaceMapping.kernels import WaterMapKernels
+        threshold = opspec.get('threshold', 0.5 )
+        tdim, ydim, xdim = data_array.dims[0], data_array.dims[-2], data_array.dims[-1]
+        edges = np.searchsorted( data_array.coords[tdim].values, time_bins, side='left' )
+        water_maps, reliability = WaterMapKernels.water_maps( data_array.values[:edges[-1]], edges[:-1], threshold, self.mask_value )
+        coords = { 'time': np.array( centroid_times, dtype='datetime64[ns]' ), ydim: data_array.coords[ydim], xdim: data_array.coords[xdim] }
+        dims = [ 'time', ydim, xdim ]
+        return xr.Dataset( { "water_maps": xr.DataArray( water_maps, dims=dims, coords=coords ), "reliability": xr.DataArray( reliability, dims=dims, coords=coords ) } )
+
     def update_metrics( self, data_array: xr.DataArray, **kwargs ):
         metrics = data_array.attrs.get('metrics', {} )
         metrics.update( **kwargs )
@@ -198,6 +351,8 @@ class WaterMapGenerator(ConfigurableObject):
         highlight = kwargs.get( "highlight", True )
         ffill =  kwargs.get( "ffill", True )
         spatially_patched_water_maps: xr.DataArray = self.spatial_interpolate( )
+        if ( kwargs.get( "engine", "xarray" ) == "kernel" ) or np.issubdtype( spatially_patched_water_maps.dtype, np.integer ):
+            return self.temporal_interpolate_kernel( spatially_patched_water_maps, highlight, ffill )
         result = self.temporal_interpolate( spatially_patched_water_maps, **kwargs ) if ffill else spatially_patched_water_maps
         patched_result: xr.DataArray = result if not highlight else result.where( result == self.water_maps, result + 2 )
         return patched_result
@@ -218,18 +373,34 @@ class WaterMapGenerator(ConfigurableObject):
     def spatial_interpolate( self, **kwargs  ) -> xr.DataArray:
         print("Spatial Interpolate")
         t0 = time.time()
-        interp_persistent_classes: xr.DataArray = self.persistent_classes.interp_like(self.water_maps[0], method='nearest')
-        spatial_interpolate_partial = functools.partial(self.spatial_interpolate_slice, interp_persistent_classes )
-        result: xr.DataArray = self.water_maps.groupby( "time.year" ).map( spatial_interpolate_partial, **kwargs ).persist()
+        dynamics_class = kwargs.get( "dynamics_class", 0 )
+        integer_classes = np.issubdtype( self.persistent_classes.dtype, np.integer ) and np.issubdtype( self.water_maps.dtype, np.integer )
+        regridder = self.get_regridder( "persistent_classes", self.persistent_classes, self.water_maps[0] )
+        persistent_classes: xr.DataArray = regridder.apply( self.persistent_classes, fill_value = self.gap_value if integer_classes else np.nan )
+        classes: np.ndarray = persistent_classes.values
+        if classes.ndim == 3:
+            classes = classes[ self.get_year_index( persistent_classes, self.water_maps ) ]
+        water_maps: np.ndarray = self.water_maps.values
+        if integer_classes: classes = classes.astype( water_maps.dtype, copy=False )
+        result: xr.DataArray = self.water_maps.copy( data = np.where( classes == dynamics_class, water_maps, classes ) )
         print(f"Done spatial interpolate in time {time.time() - t0}")
         return result
 
-    def spatial_interpolate_slice(self, persistent_classes: xr.DataArray, water_maps_slice: xr.DataArray, **kwargs ) -> xr.DataArray:
-        dynamics_class = kwargs.get( "dynamics_class", 0 )
-        tval = water_maps_slice.coords[ water_maps_slice.dims[0] ].values[0]
-        persistent_classes_slice = persistent_classes if persistent_classes.ndim == 2 else persistent_classes.sel( **{persistent_classes.dims[0]:tval}, method="nearest" ).drop_vars( persistent_classes.dims[0] )
-        dynamics_mask: xr.DataArray = persistent_classes_slice.isin( [dynamics_class] )
-        return water_maps_slice.where( dynamics_mask, persistent_classes_slice  )
+    def get_regridder( self, name: str, source: xr.DataArray, target: xr.DataArray ):
+        """ Index-mapping regridder from the source to the target grid, rebuilt only when either grid changes """
+        from geoproc.util.regrid import GridIndexMap
+        regridder: Optional[GridIndexMap] = self._regridders.get( name )
+        if ( regridder is None ) or not regridder.matches( source, target ):
+            regridder = GridIndexMap( source, target )
+            self._regridders[ name ] = regridder
+        return regridder
+
+    @classmethod
+    def get_year_index( cls, yearly_data: xr.DataArray, data: xr.DataArray ) -> np.ndarray:
+        """ For each time step of data, the index of the yearly_data slice nearest to the first time step of its year """
+        times = pd.DatetimeIndex( data.coords[ data.dims[0] ].values )
+        first_times = pd.Series( times ).groupby( times.year ).transform( "min" ).values
+        return pd.Index( yearly_data.coords[ yearly_data.dims[0] ].values ).get_indexer( first_times, method="nearest" )
 
     def show(self, data: xr.DataArray, name: str ):
         data.name = name
@@ -251,6 +422,22 @@ class WaterMapGenerator(ConfigurableObject):
         print( f"Done interpolate in time {time.time() - t0}" )
         return xr.where( nodata_mask, 0, result )
 
+    def temporal_interpolate_kernel( self, water_maps: xr.DataArray, highlight: bool = True, ffill: bool = True ) -> xr.DataArray:
+        from geoproc.surfaceMapping.kernels import WaterMapKernels
+        t0 = time.time()
+        gap_value = self.gap_value
+        values: np.ndarray = water_maps.values
+        if np.issubdtype( values.dtype, np.floating ):
+            classes = np.where( np.isnan(values), gap_value, values ).astype( np.uint8 )
+        else:
+            classes = values.astype( np.uint8, copy=False )
+        if ffill: WaterMapKernels.fill_gaps( classes, gap_value, 0 )
+        unfilled = ( classes == gap_value )
+        if highlight: np.add( classes, 2, out=classes, where=( classes != self.water_maps.values ) )
+        classes[ unfilled ] = self.mask_value
+        print( f"Done interpolate in time {time.time() - t0}" )
+        return water_maps.copy( data=classes )
+
     def time_merge( cls, data_arrays: List[xr.DataArray], **kwargs ) -> xr.DataArray:
         time_axis = kwargs.get('time',None)
         frame_indices = range( len(data_arrays) )
@@ -280,6 +467,9 @@ class WaterMapGenerator(ConfigurableObject):
         results_dir = kwargs.get('results_dir')
         lake_id = kwargs.get('lake_index')
         download = kwargs.get( 'download', True )
+        max_workers = kwargs.get( 'max_workers', None )
+        dtype = kwargs.get( 'source', {} ).get( 'dtype', 'f4' )
+        counted_times = kwargs.get( 'counted_times', None )
 
         from geoproc.data.mwp import MWPDataManager
         from geoproc.xext.xrio import XRio
@@ -294,6 +484,7 @@ class WaterMapGenerator(ConfigurableObject):
         year_range = kwargs.get('year_range')
         day_range = kwargs.get('day_range',[0,365])
         dataMgr = MWPDataManager(results_dir, data_url)
+        tileCache = self.get_tile_cache( source_spec.get( 'cache', None ) )
 
         cropped_tiles: Dict[str,xr.DataArray] = {}
         file_paths = []
@@ -303,9 +494,22 @@ class WaterMapGenerator(ConfigurableObject):
             try:
                 print( f"Reading Location {location}" )
                 dataMgr.setDefaults(product=product, download=download, years=range(int(year_range[0]),int(year_range[1])+1), start_day=int(day_range[0]), end_day=int(day_range[1]))
-                file_paths = dataMgr.get_tile(location)
-                time_values = np.array([ self.get_date_from_filename(os.path.basename(path)) for path in file_paths], dtype='datetime64[ns]')
-                cropped_tiles[location] =  XRio.load( file_paths, mask=self.roi_bounds, band=0, mask_value=self.mask_value, index=time_values )
+                if tileCache is None:
+                    file_paths = dataMgr.get_tile(location)
+                    time_values = np.array([ self.get_date_from_filename(os.path.basename(path)) for path in file_paths], dtype='datetime64[ns]')
+                    if counted_times is not None:
+                        selected = self.get_uncounted_mask( time_values, counted_times )
+                        file_paths, time_values = [ path for path, select in zip( file_paths, selected ) if select ], time_values[selected]
+                    if len( file_paths ) == 0: continue
+                    cropped_tiles[location] =  XRio.load( file_paths, mask=self.roi_bounds, band=0, mask_value=self.mask_value, index=time_values, max_workers=max_workers, dtype=dtype )
+                else:
+                    cropped_tile = self.get_cached_tile( tileCache, dataMgr, location, product, day_range, max_workers=max_workers, dtype=dtype )
+                    if ( cropped_tile is not None ) and ( counted_times is not None ):
+                        selected = self.get_uncounted_mask( cropped_tile.coords[ cropped_tile.dims[0] ].values, counted_times )
+                        cropped_tile = cropped_tile.isel( { cropped_tile.dims[0]: selected } ) if selected.any() else None
+                    if cropped_tile is not None:
+                        cropped_tiles[location] = cropped_tile
+                        time_values = cropped_tile.coords[ cropped_tile.dims[0] ].values
             except Exception as err:
                 print( f"Error reading mpw data for location {location}, first file paths = {file_paths[0:10]} ")
                 for file in file_paths:
@@ -316,19 +520,41 @@ class WaterMapGenerator(ConfigurableObject):
         nTiles = len( cropped_tiles.keys() )
         if nTiles > 0:
             print( f"Merging {nTiles} Tiles ")
-            cropped_data = self.merge_tiles( cropped_tiles)
+            cropped_data = self.merge_tiles( cropped_tiles, lazy = ( source_spec.get( 'mosaic', 'eager' ) == 'lazy' ) )
             cropped_data.attrs.update( roi = self.roi_bounds )
             cropped_data = cropped_data.persist()
         print(f"Done reading mpw data for lake {lake_id} in time {time.time()-t0}, nTiles = {nTiles}")
         return cropped_data, time_values
 
-    def merge_tiles(self, cropped_tiles: Dict[str,xr.DataArray] ) -> xr.DataArray:
-        lat_bins = {}
-        for (key, cropped_tile) in cropped_tiles.items():
-            lat_bins.setdefault( key[0:4], [] ).append( cropped_tile )
-        concat_tiles = [ self.merge_along_axis( sub_arrays, -2 ) for sub_arrays in lat_bins.values() ]
-        result =  self.merge_along_axis( concat_tiles, -1 )
-        return result
+    def get_tile_cache( self, cache_spec: Optional[Union[str,Dict]] ):
+        from geoproc.data.tile_cache import TileCache
+        if cache_spec is None: return None
+        return TileCache( **cache_spec ) if isinstance( cache_spec, dict ) else TileCache( cache_spec )
+
+    def get_cached_tile( self, tileCache, dataMgr, location: str, product: str, day_range: List, **kwargs ) -> Optional[xr.DataArray]:
+        from geoproc.xext.xrio import XRio
+        day_range = [ int(day_range[0]), int(day_range[1]) ]
+        yearly_tiles: List[xr.DataArray] = []
+        for year in list( dataMgr.getParameter( "years" ) ):
+            key = tileCache.key( location, product, year, self.roi_bounds, mask_value=self.mask_value, dtype=str( kwargs.get('dtype','f4') ) )
+            file_paths = dataMgr.get_tile( location, years=[year] )
+            tile: xr.DataArray = tileCache.get( key, day_range, file_paths )
+            if tile is None:
+                if len( file_paths ) == 0: continue
+                tile = XRio.load( file_paths, mask=self.roi_bounds, band=0, mask_value=self.mask_value, max_workers=kwargs.get('max_workers'), dtype=kwargs.get('dtype','f4') )
+                if tile is None: continue
+                tileCache.put( key, day_range, tile, file_paths )
+            else:
+                print( f"Read cached tile data for location {location}, year {year}" )
+            yearly_tiles.append( tile )
+        if len( yearly_tiles ) == 0: return None
+        return yearly_tiles[0] if len( yearly_tiles ) == 1 else XRio.concat( yearly_tiles )
+
+    def merge_tiles(self, cropped_tiles: Dict[str,xr.DataArray], lazy: bool = False ) -> xr.DataArray:
+        from geoproc.xext.xrio import XRio
+        tiles = list( cropped_tiles.values() )
+        cropped_tiles.clear()
+        return XRio.mosaic( tiles, lazy=lazy, consume=True )
 
     def merge_along_axis( self, sub_arrays: List[xr.DataArray], axis: int ) -> xr.DataArray:
         if len( sub_arrays ) == 1:  return sub_arrays[0]
@@ -378,25 +604,53 @@ class WaterMapGenerator(ConfigurableObject):
         patched_water_maps_file = f"{data_dir}/{lake_id}_patched_water_masks.nc"
         cache = kwargs.get("cache", False )
         patch = kwargs.get("patch", True)
+        productCache = self.get_product_cache( opspec )
+        graph = self.get_stage_graph( opspec, **kwargs )
+        graph.get( "yearly_lake_masks" )
+        self.get_roi_bounds( opspec )
 
-        if cache==True and os.path.isfile(patched_water_maps_file):
-            patched_water_maps: xr.DataArray = xr.open_dataset(patched_water_maps_file).Water_Maps
+        cached_dataset: Optional[xr.Dataset] = productCache.read( patched_water_maps_file, graph.fingerprint( "patched_water_maps" ) ) if ( cache==True and patch ) else None
+        if cached_dataset is not None:
+            patched_water_maps: xr.DataArray = cached_dataset.Water_Maps
             patched_water_maps.attrs['cmap'] = dict(colors=self.get_water_map_colors())
         else:
-            self.yearly_lake_masks: xr.DataArray = self.get_yearly_lake_area_masks(opspec, **kwargs)
-            self.get_roi_bounds( opspec )
-            water_mapping_data = self.get_mpw_data( **opspec, cache="update" )
-            self.water_maps: xr.DataArray =  self.get_water_maps( water_mapping_data, opspec )
-            patched_water_maps = self.patch_water_maps( opspec, **kwargs ) if patch else self.water_maps
-
-        if ((cache == True) and not os.path.isfile(patched_water_maps_file)) or ( cache == "update" ):
-            sanitize(patched_water_maps).to_netcdf( patched_water_maps_file )
-            print( f"Saving patched_water_maps to {patched_water_maps_file}")
+            patched_water_maps = graph.get( "patched_water_maps" ) if patch else graph.get( "water_maps" )
+            if cache in [ True, "update" ]:
+                self.write_patched_water_maps( productCache, opspec, patched_water_maps, patched_water_maps_file, **kwargs )
 
         print(f"Completed get_patched_water_maps in time {(time.time() - t0)/60.0} minutes")
         patched_water_maps.name = lake_id
         return patched_water_maps.assign_attrs( roi = self.roi_bounds )
 
+    def sweep_water_maps( self, name: str, bin_sizes: List[int], thresholds: List[float], water_class_thresholds: List[Tuple[float,float]], **kwargs ) -> pd.DataFrame:
+        """ Lake areas for every combination of the given water_maps.bin_size, water_maps.threshold and water_class_thresholds values,
+            computed from a single read of the MWP data (see WaterMapSweep).  Areas use the geodesic cell areas of the MWP grid unless pixel_area (km^2) is given. """
+        from geoproc.surfaceMapping.sweep import WaterMapSweep
+        from geoproc.xext.xgeo import XGeo
+        t0 = time.time()
+        opspec = self.get_opspec( name.lower() )
+        graph = self.get_stage_graph( opspec, **kwargs )
+        yearly_lake_masks: Optional[xr.DataArray] = graph.get( "yearly_lake_masks" )
+        self.get_roi_bounds( opspec )
+        ( water_mapping_data, time_values ) = graph.get( "water_mapping_data" )
+        if water_mapping_data is None: raise Exception( f"No water mapping data for lake {name}" )
+        if yearly_lake_masks is not None:
+            yearly_lake_masks = self.get_regridder( "sweep_lake_masks", yearly_lake_masks, water_mapping_data[0] ).apply( yearly_lake_masks )
+        pixel_area = kwargs.get( 'pixel_area' )
+        if pixel_area is None: pixel_area = water_mapping_data.xgeo.cell_areas()
+        sweep = WaterMapSweep( water_mapping_data, int( np.gcd.reduce( bin_sizes ) ), self.mask_value, time_values, yearly_lake_masks )
+        results: pd.DataFrame = sweep.run( bin_sizes, thresholds, water_class_thresholds, pixel_area )
+        outfile_path = kwargs.get( 'outfile' )
+        if outfile_path is not None:
+            results.to_csv( outfile_path, index=False )
+            print( f"Wrote sweep results to file {outfile_path}" )
+        print(f"Completed sweep_water_maps over {len(bin_sizes)*len(thresholds)*len(water_class_thresholds)} configurations in time {time.time() - t0} secs")
+        return results
+
+    def write_patched_water_maps( self, productCache, opspec: Dict, patched_water_maps: xr.DataArray, file_path: str, **kwargs ):
+        dset = xr.Dataset( dict( Water_Maps=patched_water_maps ) )
+        productCache.write( dset, file_path, self.get_product_fingerprint( opspec, "patched_water_maps", **kwargs ), class_vars=['Water_Maps'] )
+
     def write_result_report( self, lake_index, report: str ):
         results_dir = self._opspecs.get('results_dir')
         file_path = f"{results_dir}/lake_{lake_index}_task_report.txt"
@@ -417,42 +671,71 @@ class WaterMapGenerator(ConfigurableObject):
             print(f" --------------------->> Generating result file: {result_file}")
             y_coord, x_coord = yearly_lake_masks.coords[ yearly_lake_masks.dims[-2]].values, yearly_lake_masks.coords[yearly_lake_masks.dims[-1]].values
             self.roi_bounds = [x_coord[0], x_coord[-1], y_coord[0], y_coord[-1]]
-            (water_mapping_data, time_values) = self.get_mpw_data( **self._opspecs )
-            if water_mapping_data is None:
+            graph = self.get_stage_graph( self._opspecs, **kwargs )
+            graph.put( "yearly_lake_masks", yearly_lake_masks, inputs=dict( lake_index=lake_index, roi=self.roi_bounds ) )
+            tile_stack: Optional[xr.DataArray] = kwargs.pop( 'water_mapping_data', None )
+            counted_times = self.get_counted_times( self._opspecs ) if kwargs.get( 'cache' ) == "increment" else None
+            if tile_stack is None:
+                (water_mapping_data, time_values) = self.get_mpw_data( **self._opspecs, counted_times=counted_times )
+            else:
+                water_mapping_data = tile_stack.xrio.subset( 0, self.roi_bounds[:2], self.roi_bounds[2:] )
+                time_values = water_mapping_data.coords[ water_mapping_data.dims[0] ].values
+                if counted_times is not None:
+                    selected = self.get_uncounted_mask( time_values, counted_times )
+                    water_mapping_data, time_values = ( water_mapping_data[selected], time_values[selected] ) if selected.any() else ( None, None )
+            if ( water_mapping_data is None ) and ( counted_times is None ):
                 print( "No water mapping data! ABORTING ")
                 return None
-            wmd_y_coord, wmd_x_coord = water_mapping_data.coords[ water_mapping_data.dims[-2]].values, water_mapping_data.coords[water_mapping_data.dims[-1]].values
-            self.roi_bounds = [x_coord[0], x_coord[-1], y_coord[0], y_coord[-1]]
-            wmd_roi_bounds = [wmd_x_coord[0], wmd_x_coord[-1], wmd_y_coord[0], wmd_y_coord[-1]]
-            self.yearly_lake_masks: xr.DataArray = yearly_lake_masks  # .interp_like( water_mapping_data )
-            print( f"process_yearly_lake_masks: water_mapping_data shape = {water_mapping_data.shape}, yearly_lake_masks shape = {yearly_lake_masks.shape}")
-            print(f"yearly_lake_masks roi_bounds = {self.roi_bounds}")
-            print(f"wmd roi bounds = {wmd_roi_bounds}, wmd dims = {water_mapping_data.dims}")
-            self.water_maps: xr.DataArray =  self.get_water_maps( water_mapping_data, self._opspecs, time=time_values )
-            patched_water_maps = self.patch_water_maps( self._opspecs, **kwargs )
+            if water_mapping_data is None:
+                print( "No uncounted water mapping data, using the cached water maps and probability" )
+            else:
+                wmd_y_coord, wmd_x_coord = water_mapping_data.coords[ water_mapping_data.dims[-2]].values, water_mapping_data.coords[water_mapping_data.dims[-1]].values
+                self.roi_bounds = [x_coord[0], x_coord[-1], y_coord[0], y_coord[-1]]
+                wmd_roi_bounds = [wmd_x_coord[0], wmd_x_coord[-1], wmd_y_coord[0], wmd_y_coord[-1]]
+                print( f"process_yearly_lake_masks: water_mapping_data shape = {water_mapping_data.shape}, yearly_lake_masks shape = {graph.get('yearly_lake_masks').shape}")
+                print(f"yearly_lake_masks roi_bounds = {self.roi_bounds}")
+                print(f"wmd roi bounds = {wmd_roi_bounds}, wmd dims = {water_mapping_data.dims}")
+            graph.put( "water_mapping_data", ( water_mapping_data, time_values ) )
+            patched_water_maps = graph.get( "patched_water_maps" )
             patched_water_maps.name = f"Lake {lake_index}"
-            result: xr.DataArray = sanitize(patched_water_maps).xgeo.to_utm( [250.0, 250.0] )
-            self.write_water_area_results( result, patched_water_maps_file + ".txt" )
-            if format ==  'tif':    result.xgeo.to_tif( result_file )
+            class_dtype = self.get_class_dtype( self._opspecs )
+            result: xr.DataArray = sanitize(patched_water_maps).xgeo.to_utm( [250.0, 250.0], dtype=class_dtype, plan=kwargs.get( 'warp_plan', False ) )
+            for area_format in kwargs.get( 'area_formats', [ "txt" ] ):
+                self.write_water_area_results( result, f"{patched_water_maps_file}.{area_format}" )
+            if format ==  'tif':    result.xgeo.to_tif( result_file, dtype=class_dtype )
             else:                   result.to_netcdf( result_file )
             print( f"Saving patched_water_maps for lake {lake_index} to {patched_water_maps_file}")
             return patched_water_maps.assign_attrs( roi = self.roi_bounds )
 
     def write_water_area_results(self, patched_water_maps: xr.DataArray, outfile_path: str,  **kwargs ):
+        """ Writes the water area time series table in bulk, as CSV or Parquet (requires the 'parquet' extra, pyarrow) according to the
+            extension of outfile_path, otherwise appended to the space-separated text report """
+        table = self.get_water_area_table( patched_water_maps, **kwargs )
+        extension = os.path.splitext( outfile_path )[1].lower()
+        if extension == ".csv":
+            table.to_csv( outfile_path, index=False )
+        elif extension == ".parquet":
+            table.to_parquet( outfile_path, index=False )
+        else:
+            report = pd.DataFrame( dict( date = table.date.dt.strftime( '%Y-%m-%d' ),
+                                         water_area_km2 = np.char.mod( '%.2f', table.water_area_km2.values ),
+                                         percent_interploated = np.char.mod( '%.1f', table.percent_interpolated.values ) ) )
+            with open( outfile_path, "a" ) as outfile:
+                report.to_csv( outfile, sep=' ', index=False )
+        print( f"Wrote results to file {outfile_path}")
+
+    def get_water_area_table(self, patched_water_maps: xr.DataArray, **kwargs ) -> pd.DataFrame:
+        """ Water area (km^2) and percent interpolated per time step.  The pixel area is taken from the grid resolution (in meters) unless given as pixel_area (km^2). """
         from geoproc.xext.xgeo import XGeo
         interp_water_class = kwargs.get( 'interp_water_class', 4 )
         water_classes = kwargs.get('water_classes', [2,4] )
-        time_axis = patched_water_maps.coords[ patched_water_maps.dims[0] ]
+        resolution = patched_water_maps.xgeo.resolution
+        pixel_area = kwargs.get( 'pixel_area', abs( resolution[0] * resolution[1] ) / 1.0e6 )
         water_counts, class_proportion = self.get_class_proportion(patched_water_maps, interp_water_class, water_classes)
-        with open( outfile_path, "a" ) as outfile:
-            lines = ["date water_area_km2 percent_interploated\n"]
-            for iTime in range( patched_water_maps.shape[0] ):
-                percent_interp = class_proportion.values[iTime]
-                num_water_pixels = water_counts.values[iTime]
-                date = pd.Timestamp( time_axis.values[iTime] ).to_pydatetime()
-                lines.append( f"{str(date).split(' ')[0]} {num_water_pixels/16.0:.2f} {percent_interp:.1f}\n")
-            outfile.writelines(lines)
-            print( f"Wrote results to file {outfile_path}")
+        return pd.DataFrame( dict( date = pd.DatetimeIndex( patched_water_maps.coords[ patched_water_maps.dims[0] ].values ),
+                                   water_pixels = water_counts.values,
+                                   water_area_km2 = water_counts.values * pixel_area,
+                                   percent_interpolated = class_proportion.values ) )
 
     # def write_water_maps_from_lake_masks(self, outfile_path: str, **kwargs ):
     #     from geoproc.xext.xgeo import XGeo
@@ -480,25 +763,31 @@ class WaterMapGenerator(ConfigurableObject):
         patched_water_maps_file = f"{data_dir}/{lake_id}_patched_water_masks.nc"
         cache = kwargs.get("cache", False )
 
-        self.yearly_lake_masks: xr.DataArray = self.get_yearly_lake_area_masks(opspec, **kwargs)
+        self.get_stage_graph( opspec, **kwargs ).get( "yearly_lake_masks" )
         self.get_roi_bounds( opspec )
         self.water_maps: xr.DataArray =  self.get_water_maps( None, opspec, cache=True )
         patched_water_maps = self.patch_water_maps( opspec, **kwargs )
+        productCache = self.get_product_cache( opspec )
 
-        if ((cache == True) and not os.path.isfile(patched_water_maps_file)) or ( cache == "update" ):
-            sanitize(patched_water_maps).to_netcdf( patched_water_maps_file )
-            print( f"Saving patched_water_maps to {patched_water_maps_file}")
+        if ((cache == True) and not productCache.exists(patched_water_maps_file)) or ( cache == "update" ):
+            self.write_patched_water_maps( productCache, opspec, patched_water_maps, patched_water_maps_file, **kwargs )
 
         print(f"Completed get_patched_water_maps in time {(time.time() - t0)/60.0} minutes")
         patched_water_maps.name = lake_id
         return patched_water_maps.assign_attrs( roi = self.roi_bounds )
 
     def patch_water_maps( self, opspec: Dict, **kwargs ) -> xr.DataArray:
-        self.water_probability:  xr.DataArray = self.get_water_probability( opspec, **kwargs )
-        self.persistent_classes: xr.DataArray = self.get_persistent_classes( opspec, **kwargs )
+        """ Patches self.water_maps by running the downstream stages of the pipeline graph ( water_probability, persistent_classes, patched_water_maps ) """
+        graph = self.get_stage_graph( opspec, **kwargs )
+        graph.put( "water_maps", self.water_maps )
+        return graph.get( "patched_water_maps" )
+
+    def interpolate_water_maps( self, opspec: Dict, **kwargs ) -> xr.DataArray:
         patched_water_maps: xr.DataArray = self.interpolate( **kwargs ).assign_attrs( **self.water_maps.attrs )
         patched_water_maps.attrs['cmap'] = dict( colors=self.get_water_map_colors() )
-        return patched_water_maps.fillna( self.mask_value )
+        class_dtype = self.get_class_dtype( opspec )
+        if np.issubdtype( patched_water_maps.dtype, np.floating ): patched_water_maps = patched_water_maps.fillna( self.mask_value )
+        return patched_water_maps if class_dtype is None else patched_water_maps.astype( class_dtype, copy=False )
 
     def get_cached_water_maps( self, lakeId: str ):
         opspec = self.get_opspec(lakeId.lower())
@@ -506,11 +795,18 @@ class WaterMapGenerator(ConfigurableObject):
         return self.water_maps
 
     def get_class_proportion(self, class_map: xr.DataArray, target_class: int, relevant_classes: List[int] ) -> Tuple[xr.DataArray,xr.DataArray]:
-        sdims = [ class_map.dims[-1], class_map.dims[-2] ]
-        total_relevant_population = class_map.isin( relevant_classes ).sum( dim=sdims )
-        class_population = (class_map == target_class).sum( dim=sdims )
+        class_counts: xr.DataArray = self.get_class_counts( class_map )
+        total_relevant_population = class_counts.reindex( { 'class': relevant_classes }, fill_value=0 ).sum( dim='class' )
+        class_population = class_counts.reindex( { 'class': [ target_class ] }, fill_value=0 ).sum( dim='class' )
         return ( total_relevant_population,  ( class_population / total_relevant_population ) * 100 )
 
+    def get_class_counts(self, class_map: xr.DataArray ) -> xr.DataArray:
+        """ Pixel counts of every class value per time step, in a single pass over the class map """
+        from geoproc.surfaceMapping.kernels import WaterMapKernels
+        tdim = class_map.dims[0]
+        counts: np.ndarray = WaterMapKernels.class_counts( class_map.values )
+        return xr.DataArray( counts, dims=[ tdim, 'class' ], coords={ tdim: class_map.coords[tdim], 'class': np.arange( counts.shape[1] ) } )
+
     def view_water_map_results(self, name: str, **kwargs ):
         from geoproc.plot.animation import SliceAnimation
         interp_water_class = kwargs.get( 'interp_water_class', 4 )
@@ -1,5 +1,6 @@
 from typing import List, Union, Tuple, Dict, Optional
 from geoproc.xext.xrio import XRio
+from geoproc.surfaceMapping.shared import SharedArray
 from multiprocessing import Pool, Lock, cpu_count
 from functools import partial
 import xarray as xr
@@ -16,6 +17,7 @@ class LakeMaskProcessor:
     def process_lakes( self, reproject_inputs, **kwargs ):
         year_range = self._defaults['year_range']
         return_results = kwargs.get('return_results',False)
+        kwargs['share_results'] = SharedArray.get_backend( kwargs.get( 'share_results', None ) )
         lakeMaskSpecs = self._defaults.get( "lake_masks", None )
         data_dir = lakeMaskSpecs["basedir"]
         lake_index_range = lakeMaskSpecs["lake_index_range"]
@@ -36,11 +38,110 @@ class LakeMaskProcessor:
                 elif os.path.isfile( file_path ):
                     lake_masks[lake_index][year]= self.convert( file_path ) if reproject_inputs else file_path
 
+        if kwargs.get( 'schedule', 'lake' ) == 'tile':
+            return self.process_lakes_by_tile( lakeMaskSpecs, lake_masks, **kwargs )
+
         nproc = kwargs.get('np', cpu_count())
         p = Pool(processes=nproc)
         results = p.map( partial(self.process_lake_mask, lakeMaskSpecs, kwargs ), lake_masks.items() )
         p.close()
         p.join()
+        return self.collect_results( results, return_results )
+
+    def collect_results( self, results: List, return_results: bool ) -> Optional[Dict[int,xr.DataArray]]:
+        lake_results = collections.OrderedDict()
+        for result in results:
+            if result is None: continue
+            lake_index, lake_result = result
+            if return_results and ( lake_result is not None ):
+                lake_results[lake_index] = SharedArray.restore( lake_result )
+            elif isinstance( lake_result, SharedArray ):
+                lake_result.release()
+        return lake_results if return_results else None
+
+    def process_lakes_by_tile( self, lakeMaskSpecs: Dict, lake_masks: Dict[int,Dict], **kwargs ) -> Optional[Dict[int,xr.DataArray]]:
+        """ Reads the MWP data one tile at a time into a shared stack, cropped to the lakes on that tile, and runs each lake on a single
+            Pool as soon as all of its tiles are loaded.  A tile stack is released once all of its lakes have completed, and at most
+            max_tile_stacks (default 4) stacks are kept while lakes are still running. """
+        nproc = kwargs.get('np', cpu_count())
+        max_tile_stacks = kwargs.get( 'max_tile_stacks', 4 )
+        results = []
+        lake_bounds = { lake_index: self.get_lake_bounds( sorted_file_paths ) for lake_index, sorted_file_paths in lake_masks.items() }
+        lake_tiles = self.get_lake_tiles( lake_bounds )
+        tile_lakes: Dict[str,List[int]] = collections.OrderedDict()
+        for lake_index, tiles in lake_tiles.items():
+            if not tiles: print( f"Skipping lake {lake_index}: no MWP tiles intersect its bounds" )
+            for tile in tiles: tile_lakes.setdefault( tile, [] ).append( lake_index )
+        tile_lakes = collections.OrderedDict( sorted( tile_lakes.items() ) )
+        pending: Dict[str,set] = { tile: set( lake_indices ) for tile, lake_indices in tile_lakes.items() }
+        tile_stacks: Dict[str,Optional[SharedArray]] = {}
+        running: collections.deque = collections.deque()
+        runSpecs = { key: value for key, value in kwargs.items() if key not in [ 'tile_stack', 'tile_stacks' ] }
+        with Pool( processes=nproc ) as p:
+            try:
+                for tile, lake_indices in tile_lakes.items():
+                    self.collect_completed( running, results, lake_tiles, pending, tile_stacks )
+                    while running and ( sum( stack is not None for stack in tile_stacks.values() ) >= max_tile_stacks ):
+                        running[0][1].wait()
+                        self.collect_completed( running, results, lake_tiles, pending, tile_stacks )
+                    print( f"Processing {len(lake_indices)} lakes on tile {tile}" )
+                    tile_stacks[tile] = self.load_tile_stack( tile, [ lake_bounds[lake_index] for lake_index in lake_indices ] )
+                    for lake_index in lake_indices:
+                        if lake_tiles[lake_index][-1] != tile: continue
+                        stacks = [ tile_stacks[lake_tile] for lake_tile in lake_tiles[lake_index] if tile_stacks[lake_tile] is not None ]
+                        if stacks:
+                            task = p.apply_async( self.process_lake_mask, ( lakeMaskSpecs, dict( runSpecs, tile_stacks=stacks ), (lake_index, lake_masks[lake_index]) ) )
+                            running.append( ( lake_index, task ) )
+                        else:
+                            self.complete_lake( lake_index, lake_tiles, pending, tile_stacks )
+                while running:
+                    running[0][1].wait()
+                    self.collect_completed( running, results, lake_tiles, pending, tile_stacks )
+            finally:
+                for tile_stack in tile_stacks.values():
+                    if tile_stack is not None: tile_stack.release()
+        return self.collect_results( results, kwargs.get('return_results',False) )
+
+    def collect_completed( self, running: collections.deque, results: List, lake_tiles: Dict[int,List[str]], pending: Dict[str,set], tile_stacks: Dict[str,Optional[SharedArray]] ):
+        """ Moves the results of finished lakes from running to results, releasing the tile stacks that no longer have pending lakes """
+        for lake_index, task in list( running ):
+            if task.ready():
+                running.remove( ( lake_index, task ) )
+                results.append( task.get() )
+                self.complete_lake( lake_index, lake_tiles, pending, tile_stacks )
+
+    def complete_lake( self, lake_index: int, lake_tiles: Dict[int,List[str]], pending: Dict[str,set], tile_stacks: Dict[str,Optional[SharedArray]] ):
+        for tile in lake_tiles[lake_index]:
+            pending[tile].discard( lake_index )
+            if not pending[tile] and ( tile_stacks.get( tile ) is not None ):
+                tile_stacks[tile].release()
+                tile_stacks[tile] = None
+
+    def get_lake_bounds( self, sorted_file_paths: Dict[int,str] ) -> List[float]:
+        lake_mask: xr.DataArray = XRio.open( 0, list(sorted_file_paths.values())[0], band=0 )
+        y_coord, x_coord = lake_mask.coords[ lake_mask.dims[-2] ].values, lake_mask.coords[ lake_mask.dims[-1] ].values
+        return [ x_coord[0], x_coord[-1], y_coord[0], y_coord[-1] ]
+
+    def get_lake_tiles( self, lake_bounds: Dict[int,List[float]] ) -> Dict[int,List[str]]:
+        """ Maps each lake to the sorted list of tiles its bounds intersect """
+        from geoproc.surfaceMapping.util import TileLocator
+        tile_members = TileLocator.tile_members( { lake_index: TileLocator.bounds_geometry( *bounds ) for lake_index, bounds in lake_bounds.items() } )
+        lake_tiles: Dict[int,List[str]] = collections.OrderedDict( ( lake_index, [] ) for lake_index in lake_bounds )
+        for tile, lake_indices in tile_members.items():
+            for lake_index in lake_indices: lake_tiles[lake_index].append( tile )
+        return collections.OrderedDict( ( lake_index, sorted( tiles ) ) for lake_index, tiles in lake_tiles.items() )
+
+    def load_tile_stack( self, tile: str, lake_bounds: List[List[float]] ) -> Optional[SharedArray]:
+        """ Reads a single tile, cropped to the union of the bounds of the given lakes, into a shared stack """
+        from geoproc.surfaceMapping.lakeExtentMapping import WaterMapGenerator
+        xvals = [ x for bounds in lake_bounds for x in bounds[:2] ]
+        yvals = [ y for bounds in lake_bounds for y in bounds[2:] ]
+        waterMapGenerator = WaterMapGenerator( dict( **self._defaults ) )
+        waterMapGenerator.roi_bounds = [ min(xvals), max(xvals), min(yvals), max(yvals) ]
+        source_spec = dict( self._defaults.get('source',{}), location=[ tile ] )
+        (water_mapping_data, time_values) = waterMapGenerator.get_mpw_data( **dict( self._defaults, source=source_spec ) )
+        if water_mapping_data is None: return None
+        return SharedArray.create( water_mapping_data, self._defaults.get('results_dir'), f"tile_stack_{tile}" )
 
     def process_lake_mask(self, lakeMaskSpecs: Dict, runSpecs: Dict, lake_mask_files: Tuple[int,Dict] ):
         lake_index, sorted_file_paths = lake_mask_files
@@ -52,7 +153,11 @@ class LakeMaskProcessor:
             nx, ny = yearly_lake_masks.shape[-1], yearly_lake_masks.shape[-2]
             lake_results = self.process_lake_masks(lake_index, yearly_lake_masks, **runSpecs )
             print(f"Completed processing lake {lake_index}")
-            return  [lake_index, lake_results, yearly_lake_masks]
+            share_results = runSpecs.get( 'share_results', None )
+            if share_results:
+                results_dir = self._defaults.get('results_dir')
+                return [ lake_index, SharedArray.share( lake_results, results_dir, f"lake_{lake_index}_results", share_results ) ]
+            return  [lake_index, lake_results]
         except Exception as err:
             print(f"Skipping lake {lake_index} due to errors ")
             traceback.print_exc()
@@ -67,7 +172,12 @@ class LakeMaskProcessor:
 
     def process_lake_masks(self, lake_index: int, mask_files: xr.DataArray, **kwargs ) -> Optional[xr.DataArray]:
         from geoproc.surfaceMapping.lakeExtentMapping import WaterMapGenerator
+        tile_stacks: Optional[List[SharedArray]] = kwargs.pop( 'tile_stacks', None )
         waterMapGenerator = WaterMapGenerator( { 'lake_index': lake_index, **self._defaults } )
+        if tile_stacks:
+            y_coord, x_coord = mask_files.coords[ mask_files.dims[-2] ].values, mask_files.coords[ mask_files.dims[-1] ].values
+            cropped_tiles = { iS: tile_stack.open().xrio.subset( 0, [ x_coord[0], x_coord[-1] ], [ y_coord[0], y_coord[-1] ] ) for iS, tile_stack in enumerate( tile_stacks ) }
+            kwargs['water_mapping_data'] = cropped_tiles[0] if len( cropped_tiles ) == 1 else waterMapGenerator.merge_tiles( cropped_tiles )
         return waterMapGenerator.process_yearly_lake_masks( lake_index, mask_files, **kwargs )
 
     def write_result_report( self, lake_index, report: str ):
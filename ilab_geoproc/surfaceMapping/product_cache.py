@@ -0,0 +1,90 @@
+import os, shutil, hashlib, json
+import numpy as np
+import xarray as xr
+from typing import List, Union, Tuple, Dict, Optional
+from geoproc.util.configuration import sanitize
+
+class ProductCache:
+    """  Cache backend for WaterMapGenerator intermediate products.  Products are written as chunked, compressed stores (NetCDF4/zlib or Zarr),
+         with class-valued variables encoded as uint8, and are read back with their file handles closed.  Each store records a fingerprint of the opspec inputs it was
+         computed from, so a store computed from different inputs is reported as stale and recomputed rather than silently reused. """
+
+    def __init__( self, format: str = "netcdf", complevel: int = 4, chunk_size: int = 512, time_chunk: int = 16 ):
+        if format not in [ "netcdf", "zarr" ]: raise Exception( f"Unrecognized product cache format: {format}" )
+        self.format = format
+        self.complevel = complevel
+        self.chunk_size = chunk_size
+        self.time_chunk = time_chunk
+
+    @classmethod
+    def fingerprint( cls, inputs: Dict ) -> str:
+        return hashlib.sha1( json.dumps( inputs, sort_keys=True, default=str ).encode() ).hexdigest()[:16]
+
+    def store_path( self, file_path: str ) -> str:
+        return os.path.splitext( file_path )[0] + ".zarr" if self.format == "zarr" else file_path
+
+    def exists( self, file_path: str ) -> bool:
+        return os.path.exists( self.store_path( file_path ) )
+
+    def read( self, file_path: str, fingerprint: Optional[str] = None, load: bool = True ) -> Optional[xr.Dataset]:
+        """ Opens the store for file_path, returning None if it is missing or was computed from inputs other than fingerprint.
+            If load the data is read into memory and the store closed, otherwise the dataset is lazy and must be closed by the caller. """
+        path = self.store_path( file_path )
+        if not os.path.exists( path ): return None
+        dset: xr.Dataset = xr.open_zarr( path ) if self.format == "zarr" else xr.open_dataset( path, chunks={} )
+        stored_fingerprint = dset.attrs.get( 'fingerprint' )
+        if ( fingerprint is not None ) and ( stored_fingerprint != fingerprint ):
+            print( f"Cached product {path} is stale (inputs {stored_fingerprint} != {fingerprint}), recomputing" )
+            dset.close()
+            return None
+        if load:
+            with dset: dset.load()
+        return dset
+
+    def write( self, dset: xr.Dataset, file_path: str, fingerprint: Optional[str] = None, class_vars: List[str] = () ):
+        """ Atomically (re)writes the store for file_path; the variables named in class_vars hold class values and are stored as uint8 where possible """
+        path = self.store_path( file_path )
+        dset = xr.Dataset( { name: sanitize( self.unencoded( var ) ) for name, var in dset.data_vars.items() }, attrs=dict( dset.attrs ) )
+        if fingerprint is not None: dset.attrs['fingerprint'] = fingerprint
+        encoding = { name: self.encoding( var, name in class_vars ) for name, var in dset.data_vars.items() }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if self.format == "zarr":
+            dset.to_zarr( tmp_path, mode="w", encoding=encoding )
+            if os.path.exists( path ): shutil.rmtree( path )
+        else:
+            dset.to_netcdf( tmp_path, encoding=encoding )
+        os.replace( tmp_path, path )
+        print( f"Cached product to {path}" )
+
+    @classmethod
+    def unencoded( cls, var: xr.DataArray ) -> xr.DataArray:
+        """ Shallow copy of var without the encoding carried over from the file it may have been read from """
+        result = var.copy( deep=False )
+        result.encoding = {}
+        for coord in result.coords.values(): coord.encoding = {}
+        return result
+
+    def encoding( self, var: xr.DataArray, class_data: bool = False ) -> Dict:
+        if var.ndim == 0: return {}
+        chunks = tuple( min( size, self.time_chunk if iD == 0 and var.ndim > 2 else self.chunk_size ) for iD, size in enumerate( var.shape ) )
+        encoding = dict( chunks=chunks ) if self.format == "zarr" else dict( zlib=True, complevel=self.complevel, chunksizes=chunks )
+        class_encoding = self.class_encoding( var ) if class_data else None
+        if class_encoding is not None: encoding.update( class_encoding )
+        return encoding
+
+    @classmethod
+    def class_encoding( cls, var: xr.DataArray ) -> Optional[Dict]:
+        """ uint8 encoding for class-valued data: integers in [0,255], or integral floats in [0,254] with NaN stored as 255.
+            The range check is a (lazy) reduction over var, so dask-backed variables are never loaded whole. """
+        if np.issubdtype( var.dtype, np.integer ):
+            if var.size:
+                stats = xr.Dataset( dict( min=var.min(), max=var.max() ) ).compute()
+                if ( stats['min'] < 0 ) or ( stats['max'] > 255 ): return None
+            return dict( dtype='u1' )
+        if np.issubdtype( var.dtype, np.floating ):
+            if var.size:
+                finite = xr.where( np.isfinite( var ), var, np.nan )
+                stats = xr.Dataset( dict( min=finite.min(), max=finite.max(), integral=( finite.fillna( 0 ) % 1 == 0 ).all() ) ).compute()
+                if ( stats['min'] < 0 ) or ( stats['max'] > 254 ) or not stats['integral']: return None
+            return dict( dtype='u1', _FillValue=255 )
+        return None
@@ -0,0 +1,95 @@
+import numpy as np
+import xarray as xr
+import os, uuid
+from typing import List, Union, Tuple, Dict, Optional
+
+class SharedArray:
+    """  Picklable handle to an array stored in a memory-mapped .npy file (backend="mmap") or a multiprocessing.shared_memory block (backend="shm"),
+         used to pass large cubes between Pool workers without serializing the data """
+
+    BACKENDS = [ "mmap", "shm" ]
+
+    def __init__( self, path: str, shape: Tuple, dtype: str, dims: Tuple, coords: Dict[str,np.ndarray], name: str = None, attrs: Dict = None, backend: str = "mmap" ):
+        self.path = path
+        self.shape = tuple( shape )
+        self.dtype = str( dtype )
+        self.dims = tuple( dims )
+        self.coords = coords
+        self.name = name
+        self.attrs = {} if attrs is None else attrs
+        self.backend = backend
+        self._shm = None
+
+    def __getstate__(self):
+        return { key: value for key, value in self.__dict__.items() if key != "_shm" }
+
+    def __setstate__(self, state: Dict ):
+        self.__dict__.update( state )
+        self._shm = None
+
+    @classmethod
+    def get_backend( cls, spec: Union[bool,str,None] ) -> Optional[str]:
+        """ Normalizes a share_results spec: False/None disables sharing, True selects the default (mmap) backend """
+        if ( spec is None ) or ( spec is False ): return None
+        if spec is True: return "mmap"
+        if spec not in cls.BACKENDS: raise Exception( f"Unrecognized shared array backend: {spec}, expected one of {cls.BACKENDS}" )
+        return spec
+
+    @classmethod
+    def create( cls, data_array: xr.DataArray, base_dir: str = None, prefix: str = "shared", backend: str = "mmap" ) -> "SharedArray":
+        coords = { dim: data_array.coords[dim].values for dim in data_array.dims if dim in data_array.coords }
+        if backend == "mmap":
+            path = os.path.join( base_dir, f"{prefix}_{uuid.uuid4().hex}.npy" )
+            buffer: np.ndarray = np.lib.format.open_memmap( path, mode='w+', dtype=data_array.dtype, shape=data_array.shape )
+            buffer[...] = data_array.values
+            buffer.flush()
+            del buffer
+            return SharedArray( path, data_array.shape, data_array.dtype, data_array.dims, coords, data_array.name, dict( data_array.attrs ), backend )
+        elif backend == "shm":
+            from multiprocessing import shared_memory, resource_tracker
+            shm = shared_memory.SharedMemory( create=True, size=max( data_array.nbytes, 1 ) )
+            np.ndarray( data_array.shape, dtype=data_array.dtype, buffer=shm.buf )[...] = data_array.values
+            resource_tracker.unregister( shm._name, "shared_memory" )
+            result = SharedArray( shm.name, data_array.shape, data_array.dtype, data_array.dims, coords, data_array.name, dict( data_array.attrs ), backend )
+            shm.close()
+            return result
+        else:
+            raise Exception( f"Unrecognized shared array backend: {backend}")
+
+    def open( self ) -> xr.DataArray:
+        if self.backend == "shm":
+            from multiprocessing import shared_memory
+            if self._shm is None: self._shm = shared_memory.SharedMemory( name=self.path )
+            data: np.ndarray = np.ndarray( self.shape, dtype=np.dtype(self.dtype), buffer=self._shm.buf )
+        else:
+            data: np.ndarray = np.load( self.path, mmap_mode='r' )
+        return xr.DataArray( data, dims=self.dims, coords=self.coords, name=self.name, attrs=self.attrs )
+
+    def release( self ):
+        """ Frees the underlying storage; arrays returned by open() must not be used afterwards """
+        if self.backend == "shm":
+            from multiprocessing import shared_memory
+            shm = self._shm if self._shm is not None else shared_memory.SharedMemory( name=self.path )
+            self._shm = None
+            try: shm.close()
+            except BufferError: pass
+            try: shm.unlink()
+            except FileNotFoundError: pass
+        else:
+            try: os.remove( self.path )
+            except OSError: pass
+
+    @classmethod
+    def share( cls, value, base_dir: str = None, prefix: str = "shared", backend: str = "mmap" ):
+        return cls.create( value, base_dir, prefix, backend ) if isinstance( value, xr.DataArray ) else value
+
+    def load( self ) -> xr.DataArray:
+        """ Copies the shared data into process memory and releases the shared storage """
+        result: xr.DataArray = self.open().copy( deep=True )
+        self.release()
+        return result
+
+    @classmethod
+    def restore( cls, value ):
+        """ Returns an in-memory copy of a shared value, releasing its shared storage """
+        return value.load() if isinstance( value, SharedArray ) else value
@@ -0,0 +1,115 @@
+import time, collections
+from typing import List, Union, Tuple, Dict, Optional, Any
+
+class StageGraph:
+    """  Explicit dependency graph of the WaterMapGenerator pipeline stages.  Each stage is fingerprinted from its own opspec inputs
+         together with the fingerprints of its upstream stages, and its result is memoized on the generator under that fingerprint.
+         Re-running the pipeline with a modified opspec therefore recomputes only the stages whose inputs changed: e.g. a new set of
+         water_class_thresholds recomputes persistent_classes and patched_water_maps, but reuses the water maps and water probability.
+         Stages that are persisted in the product cache are read from it (when cache=True) before any of their upstream stages are computed.
+         With cache="increment" the water maps and water probability are read from the cache whenever the uncounted inputs do not fill
+         a complete water map bin, so that a run with no new data reproduces the cached products. """
+
+    DEPENDENCIES: Dict[str,List[str]] = collections.OrderedDict( [
+        ( "yearly_lake_masks",  [] ),
+        ( "water_mapping_data", [] ),
+        ( "water_maps",         [ "water_mapping_data" ] ),
+        ( "water_probability",  [ "water_maps" ] ),
+        ( "persistent_classes", [ "water_probability", "yearly_lake_masks" ] ),
+        ( "patched_water_maps", [ "water_maps", "persistent_classes" ] ) ] )
+
+    PERSISTED = [ "yearly_lake_masks", "water_maps", "water_probability" ]
+    GENERATOR_ATTRIBUTES = [ "yearly_lake_masks", "water_maps", "water_probability", "persistent_classes" ]
+
+    def __init__( self, generator, opspec: Dict, **kwargs ):
+        self.generator = generator
+        self.opspec = opspec
+        self.cache = kwargs.get( "cache", False )
+        self.kwargs = kwargs
+        self._inputs: Dict[str,Dict] = {}
+
+    @classmethod
+    def downstream( cls, stage: str ) -> List[str]:
+        """ The stages that (directly or indirectly) depend on stage, in pipeline order """
+        result = []
+        for name, dependencies in cls.DEPENDENCIES.items():
+            if any( ( dep == stage ) or ( dep in result ) for dep in dependencies ): result.append( name )
+        return result
+
+    def inputs( self, stage: str ) -> Dict:
+        if stage not in self.DEPENDENCIES: raise Exception( f"Unrecognized pipeline stage: {stage}" )
+        stage_inputs = self._inputs.get( stage )
+        if stage_inputs is None: stage_inputs = self.generator.get_stage_inputs( self.opspec, stage, **self.kwargs )
+        return dict( stage_inputs, upstream = { dep: self.fingerprint( dep ) for dep in self.DEPENDENCIES[stage] } )
+
+    def fingerprint( self, stage: str ) -> str:
+        from geoproc.surfaceMapping.product_cache import ProductCache
+        return ProductCache.fingerprint( self.inputs( stage ) )
+
+    def put( self, stage: str, result: Any, inputs: Optional[Dict] = None ):
+        """ Supplies the result of a stage computed outside the graph.  If given, inputs replace the opspec inputs used to fingerprint the stage. """
+        if inputs is not None: self._inputs[stage] = inputs
+        self.store( stage, self.fingerprint( stage ), result )
+
+    def get( self, stage: str ) -> Any:
+        """ Returns the result of stage, computing it and any of its out-of-date upstream stages as required """
+        fingerprint = self.fingerprint( stage )
+        memo: Optional[Tuple[str,Any]] = self.generator._stage_results.get( stage )
+        if ( memo is not None ) and ( memo[0] == fingerprint ):
+            print( f"Reusing {stage} ({fingerprint})" )
+            result = memo[1]
+        elif ( stage in self.PERSISTED ) and self.use_cache( stage ) and self.is_cached( stage, fingerprint ):
+            result = self.compute( stage, cache=True )
+        else:
+            for dep in self.DEPENDENCIES[stage]: self.get( dep )
+            t0 = time.time()
+            result = self.compute( stage, cache=( "update" if self.cache == True else self.cache ) )
+            print( f"Computed stage {stage} ({fingerprint}) in time {time.time()-t0:.2f} secs" )
+        self.store( stage, fingerprint, result )
+        return result
+
+    def use_cache( self, stage: str ) -> bool:
+        if self.cache == True: return True
+        return ( self.cache == "increment" ) and ( stage in self.downstream( "water_mapping_data" ) ) and not self.has_new_bins()
+
+    def has_new_bins( self ) -> bool:
+        """ Whether the (in increment mode, uncounted) water mapping data fill at least one complete water map bin """
+        ( water_mapping_data, time_values ) = self.get( "water_mapping_data" )
+        if water_mapping_data is None: return False
+        return self.generator.get_bin_count( self.opspec, len( time_values ) ) > 0
+
+    def store( self, stage: str, fingerprint: str, result: Any ):
+        self.generator._stage_results[stage] = ( fingerprint, result )
+        if stage in self.GENERATOR_ATTRIBUTES: setattr( self.generator, stage, result )
+
+    def is_cached( self, stage: str, fingerprint: str ) -> bool:
+        file_path = self.generator.get_product_file( self.opspec, stage )
+        if file_path is None: return False
+        cached_dataset = self.generator.get_product_cache( self.opspec ).read( file_path, fingerprint, load=False )
+        if cached_dataset is None: return False
+        cached_dataset.close()
+        return True
+
+    def compute( self, stage: str, cache: Union[bool,str] ) -> Any:
+        """ Runs the generator method of stage, with its upstream stage results installed on the generator """
+        generator, opspec = self.generator, self.opspec
+        kwargs = dict( self.kwargs, cache=cache )
+        if stage == "yearly_lake_masks":
+            return generator.get_yearly_lake_area_masks( opspec, **self.kwargs )
+        if stage == "water_mapping_data":
+            counted_times = generator.get_counted_times( opspec ) if self.cache == "increment" else None
+            return generator.get_mpw_data( **opspec, counted_times=counted_times )
+        if stage == "water_maps":
+            if cache == True: return generator.get_water_maps( None, opspec, cache=True )
+            ( water_mapping_data, time_values ) = self.generator._stage_results["water_mapping_data"][1]
+            if water_mapping_data is None: raise Exception( f"No water mapping data for lake {opspec.get('lake_index')}" )
+            return generator.get_water_maps( water_mapping_data, opspec, cache=cache, time=time_values )
+        if stage == "water_probability":
+            water_mapping_data = self.generator._stage_results.get( "water_mapping_data" )
+            input_times = None if water_mapping_data is None else water_mapping_data[1][1]
+            return generator.get_water_probability( opspec, input_times=input_times, **kwargs )
+        if stage == "persistent_classes":
+            return generator.get_persistent_classes( opspec, **kwargs )
+        if stage == "patched_water_maps":
+            return generator.interpolate_water_maps( opspec, **self.kwargs )
+        raise Exception( f"Unrecognized pipeline stage: {stage}" )
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from typing import List, Union, Tuple, Dict, Optional, Sequence
+
+class WaterMapSweep:
+    """  Evaluates the lake area time series of many water mapping configurations ( water_maps.bin_size, water_maps.threshold and
+         water_class_thresholds ) from a single MWP class cube.  Per-pixel land/water counts are computed once for the finest bin size,
+         coarser bins are derived by summing them, and all water_class_thresholds variants are evaluated together as vectorized comparisons.
+         As in WaterMapGenerator.get_persistent_classes, persistent classes are computed from the yearly water probability within the
+         yearly lake masks (given on the grid of data_array) or else from the whole-record water probability.  Lake areas count the water
+         and interpolated-water classes of the patched water maps, weighted by pixel_area ( km^2, a scalar or one value per (y,x) pixel ). """
+
+    def __init__( self, data_array: xr.DataArray, bin_size: int, mask_value: int = 5, time_values: Optional[np.ndarray] = None, yearly_lake_masks: Optional[xr.DataArray] = None ):
+        from geoproc.surfaceMapping.kernels import WaterMapKernels
+        self.bin_size = bin_size
+        self.mask_value = mask_value
+        self.time_axis: np.ndarray = data_array.coords[ data_array.dims[0] ].values if time_values is None else np.asarray( time_values )
+        self.shape = data_array.shape[1:]
+        self.yearly_lake_masks = yearly_lake_masks
+        data: np.ndarray = data_array.values
+        edges = self.bin_edges( bin_size )
+        land, water = WaterMapKernels.bin_class_counts( data[:edges[-1]], edges[:-1] )
+        masked = WaterMapKernels.as_class_array( data[ edges[:-1] ] ) == mask_value
+        self._counts = ( land.reshape( land.shape[0], -1 ), water.reshape( water.shape[0], -1 ), masked.reshape( masked.shape[0], -1 ) )
+
+    def bin_edges( self, bin_size: int ) -> np.ndarray:
+        """ Start indices of the time bins of WaterMapGenerator.get_water_maps; the last edge closes the last bin """
+        return np.arange( 0, self.time_axis.shape[0], bin_size )
+
+    def centroid_times( self, bin_size: int ) -> np.ndarray:
+        edges = self.bin_edges( bin_size )
+        return np.array( self.time_axis[ np.arange( bin_size//2, edges[-1], bin_size ) ], dtype='datetime64[ns]' )
+
+    def bin_counts( self, bin_size: int ) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+        """ ( land, water, masked ) per ( bin, pixel ) for bin_size, which must be a multiple of the sweep's finest bin size """
+        if bin_size % self.bin_size: raise Exception( f"Bin size {bin_size} is not a multiple of the finest sweep bin size {self.bin_size}" )
+        factor, nbins = bin_size // self.bin_size, self.bin_edges( bin_size ).shape[0] - 1
+        land, water, masked = self._counts
+        if factor == 1: return land, water, masked
+        land = land[:nbins*factor].reshape( nbins, factor, -1 ).sum( axis=1, dtype=np.uint16 )
+        water = water[:nbins*factor].reshape( nbins, factor, -1 ).sum( axis=1, dtype=np.uint16 )
+        return land, water, masked[:nbins*factor:factor]
+
+    def year_bins( self, bin_size: int ) -> Tuple[np.ndarray,Optional[np.ndarray]]:
+        """ ( year index of each bin, (year,pixel) lake mask or None ).  Without yearly lake masks all bins share a single whole-record year.
+            Each year takes the lake mask nearest to July 1 of that year, as the yearly water probability is regridded in the pipeline. """
+        from geoproc.util.regrid import GridIndexMap
+        times = pd.DatetimeIndex( self.centroid_times( bin_size ) )
+        if self.yearly_lake_masks is None: return np.zeros( times.shape[0], dtype=np.intp ), None
+        years, year_index = np.unique( times.year, return_inverse=True )
+        masks = self.yearly_lake_masks
+        probability_times = np.array( [ np.datetime64( f"{year:04d}-07-01" ) for year in years ], dtype='datetime64[ns]' )
+        indices, valid = GridIndexMap.nearest_indices( masks.coords[ masks.dims[0] ].values, probability_times )
+        lake_mask = ( masks.values.reshape( masks.shape[0], -1 )[ indices ] == masks.attrs['mask'] ) & valid.reshape( -1, 1 )
+        return year_index, lake_mask
+
+    def evaluate( self, bin_size: int, threshold: float, class_thresholds: Sequence[Tuple[float,float]], pixel_area: Union[float,np.ndarray] = 1.0 ) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+        """ Returns ( water pixel counts, interpolated water pixel counts, water areas ), each of shape ( len(class_thresholds), nbins ) """
+        land, water, masked = self.bin_counts( bin_size )
+        visible = land.astype( np.float64 ) + water
+        with np.errstate( divide='ignore', invalid='ignore' ):
+            is_water = ( ( water / visible ) >= threshold ) & ~masked
+        is_land = ~is_water & ( land > 0 ) & ~masked
+        year_index, lake_mask = self.year_bins( bin_size )
+        nyears = int( year_index.max( initial=0 ) ) + 1
+        year_bins = ( year_index.reshape( 1, -1 ) == np.arange( nyears ).reshape( -1, 1 ) ).astype( np.float64 )
+        water_cnts, land_cnts = year_bins @ is_water, year_bins @ is_land
+        with np.errstate( divide='ignore', invalid='ignore' ):
+            water_probability = water_cnts / ( water_cnts + land_cnts )
+        water_probability[ :, masked[0] ] = 1.01
+        unmasked = ~( water_probability > 1.0 ) if lake_mask is None else ~( ( water_probability > 1.0 ) | lake_mask )
+        thresholds = np.asarray( class_thresholds, dtype=np.float64 ).reshape( -1, 1, 2, 1 )
+        persistent_water = unmasked & ( water_probability > thresholds[:,:,1] )
+        dynamic = unmasked & ~( water_probability > thresholds[:,:,1] ) & ~( water_probability < thresholds[:,:,0] )
+        pixel_area = np.broadcast_to( np.asarray( pixel_area, dtype=np.float64 ).ravel(), is_water.shape[1:] )
+        nclasses = len( class_thresholds )
+        water_pixels, interp_pixels, water_area = np.empty( [3, nclasses, is_water.shape[0]] )
+        for iY in range( nyears ):
+            bins = ( year_index == iY )
+            year_water = is_water[bins].astype( np.float32 )
+            dynamic_water = year_water @ dynamic[:,iY].T.astype( np.float32 )
+            persistent_water_cnts = persistent_water[:,iY].sum( axis=1 )
+            observed_persistent_water = year_water @ persistent_water[:,iY].T.astype( np.float32 )
+            water_pixels[:,bins] = ( dynamic_water + persistent_water_cnts ).T
+            interp_pixels[:,bins] = ( persistent_water_cnts - observed_persistent_water ).T
+            water_area[:,bins] = ( year_water.astype( np.float64 ) @ ( dynamic[:,iY] * pixel_area ).T + persistent_water[:,iY] @ pixel_area ).T
+        return np.rint( water_pixels ).astype( np.int64 ), np.rint( interp_pixels ).astype( np.int64 ), water_area
+
+    def run( self, bin_sizes: Sequence[int], thresholds: Sequence[float], class_thresholds: Sequence[Tuple[float,float]], pixel_area: Union[float,np.ndarray] ) -> pd.DataFrame:
+        """ Lake area table with one row per ( bin_size, threshold, water_class_thresholds, time ); pixel_area is in km^2 """
+        tables = []
+        class_thresholds = [ tuple( float(x) for x in ct ) for ct in class_thresholds ]
+        for bin_size in bin_sizes:
+            times = self.centroid_times( bin_size )
+            for threshold in thresholds:
+                water_pixels, interp_pixels, water_area = self.evaluate( bin_size, threshold, class_thresholds, pixel_area )
+                with np.errstate( divide='ignore', invalid='ignore' ):
+                    percent_interp = ( interp_pixels / water_pixels ) * 100
+                tables.append( pd.DataFrame( dict(
+                    bin_size = bin_size, threshold = threshold,
+                    water_class_low = np.repeat( [ ct[0] for ct in class_thresholds ], times.shape[0] ),
+                    water_class_high = np.repeat( [ ct[1] for ct in class_thresholds ], times.shape[0] ),
+                    time = np.tile( times, len( class_thresholds ) ),
+                    water_pixels = water_pixels.ravel(),
+                    water_area_km2 = water_area.ravel(),
+                    percent_interpolated = percent_interp.ravel() ) ) )
+        return pd.concat( tables, ignore_index=True )
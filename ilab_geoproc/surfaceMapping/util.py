@@ -1,7 +1,9 @@
 import xarray as xa
+import numpy as np
 import geopandas as gpd
+import collections
 from math import floor, ceil
-from typing import List, Union, Tuple, Optional
+from typing import List, Union, Tuple, Optional, Dict
 
 class TileLocator:
 
@@ -33,24 +35,82 @@ class TileLocator:
         print( f" --> infer_tiles_xa, attrs = {array.attrs}")
         x_coord = array.coords[array.dims[-1]].values
         y_coord = array.coords[array.dims[-2]].values
-        x0, y0 = array.xgeo.project_to_geographic( x_coord[0], y_coord[0] )
-        x1, y1 = array.xgeo.project_to_geographic(x_coord[-1], y_coord[-1])
+        ( x0, x1 ), ( y0, y1 ) = array.xgeo.project_to_geographic( x_coord[[0,-1]], y_coord[[0,-1]] )
         return cls.get_tiles( x0, x1, y0, y1 )
 
     @classmethod
     def infer_tiles_gpd( cls, series: gpd.GeoSeries ) -> List[str]:
-        [xmin, ymin, xmax, ymax] = series.geometry.boundary.bounds.values[0]
+        [xmin, ymin, xmax, ymax] = series.geometry.total_bounds
         return cls.get_tiles( xmin, xmax, ymin, ymax )
 
 
     @classmethod
     def get_tiles( cls, xmin, xmax, ymin, ymax ) -> List[str]:
-        xvals = { cls.lon_label( xmin ), cls.lon_label( xmax ) }
-        yvals = { cls.lat_label( ymin ), cls.lat_label( ymax ) }
-        results = [ f"{xval}{yval}" for xval in xvals for yval in yvals ]
+        results = cls.intersecting_tiles( cls.bounds_geometry( xmin, xmax, ymin, ymax ) )
         print( f"Inferring tiles {results} from xbounds = {[xmin,xmax]}, ybounds = {[ymin,ymax]}" )
         return results
 
+    @classmethod
+    def bounds_geometry( cls, xmin, xmax, ymin, ymax ):
+        """ Box geometry for (xmin, xmax, ymin, ymax) bounds; xmin > xmax is taken to be a box spanning the antimeridian """
+        from shapely.geometry import box
+        if xmin > xmax: xmax = xmax + 360
+        return box( xmin, min( ymin, ymax ), xmax, max( ymin, ymax ) )
+
+    @classmethod
+    def tile_label( cls, west: int, north: int ) -> str:
+        """ Label of the 10 degree tile covering longitudes [west, west+10) and latitudes (north-10, north] """
+        return f"{abs(west):03d}{'W' if west < 0 else 'E'}{abs(north):03d}{'N' if north > 0 else 'S'}"
+
+    _tile_index = None
+
+    @classmethod
+    def get_tile_index( cls ):
+        """ Lazily built STRtree over the footprints of all 10 degree tiles, with the matching tile labels """
+        if cls._tile_index is None:
+            from shapely.geometry import box
+            from shapely.strtree import STRtree
+            tiles = [ ( cls.tile_label( west, north ), box( west, north - 10, west + 10, north ) ) for west in range( -180, 180, 10 ) for north in range( -80, 100, 10 ) ]
+            cls._tile_index = ( STRtree( [ tile[1] for tile in tiles ] ), [ tile[0] for tile in tiles ] )
+        return cls._tile_index
+
+    @classmethod
+    def intersecting_tiles( cls, geometry ) -> List[str]:
+        return cls.intersecting_tiles_batch( [ geometry ] )[0]
+
+    @classmethod
+    def intersecting_tiles_batch( cls, geometries ) -> List[List[str]]:
+        """ Sorted labels of the tiles whose interiors intersect each of the (geographic) geometries, in a single index query per wrap offset.
+            Geometries in 0-360 longitudes or spanning the antimeridian are matched against their wrapped copies.  A geometry touching
+            tiles only along their edges (e.g. a point on a tile boundary) gets all of the touched tiles. """
+        import shapely
+        tree, labels = cls.get_tile_index()
+        geoms = np.array( list( geometries ), dtype=object )
+        interior_hits, edge_hits = [ set() for _ in geoms ], [ set() for _ in geoms ]
+        for offset in ( -360.0, 0.0, 360.0 ):
+            shifted = shapely.transform( geoms, lambda coords: coords + [ offset, 0.0 ] )
+            igeom, itile = tree.query( shifted, predicate='intersects' )
+            touching = shapely.touches( shifted[igeom], tree.geometries[itile] )
+            for iG, iT, edge in zip( igeom, itile, touching ):
+                ( edge_hits if edge else interior_hits )[iG].add( labels[iT] )
+        return [ sorted( interior if interior else edges ) for interior, edges in zip( interior_hits, edge_hits ) ]
+
+    @classmethod
+    def group_by_tiles( cls, geometries: Dict ) -> Dict[Tuple[str],List]:
+        """ Groups the keys of a {key: geographic geometry} map by the (sorted) set of tiles each geometry intersects """
+        tile_groups = collections.OrderedDict()
+        for key, tiles in zip( geometries.keys(), cls.intersecting_tiles_batch( geometries.values() ) ):
+            tile_groups.setdefault( tuple( tiles ), [] ).append( key )
+        return tile_groups
+
+    @classmethod
+    def tile_members( cls, geometries: Dict ) -> Dict[str,List]:
+        """ Maps each tile label to the keys of the {key: geographic geometry} entries intersecting it, e.g. tile -> lakes for a lakes shapefile """
+        members = collections.OrderedDict()
+        for key, tiles in zip( geometries.keys(), cls.intersecting_tiles_batch( geometries.values() ) ):
+            for tile in tiles: members.setdefault( tile, [] ).append( key )
+        return members
+
     @classmethod
     def get_bounds(cls, array: xa.DataArray ) -> List:
         x_coord = array.coords[array.dims[-1]].values
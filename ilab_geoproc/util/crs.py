@@ -1,10 +1,39 @@
-import math, utm, os
+import math, utm, os, functools
 import xarray as xa
 from osgeo import gdal, gdalconst, ogr, osr
+from pyproj import Transformer
+from typing import Tuple, Union
 from geoproc.util.configuration import ConfigurableObject
 
+CRSSpec = Union[ osr.SpatialReference, str, int ]
+
+@functools.lru_cache( maxsize=256 )
+def get_transformer( src_crs: str, dst_crs: str ) -> Transformer:
+    """ Process-wide LRU cache of (always x/y ordered) transformers, keyed by source and destination CRS strings """
+    return Transformer.from_crs( src_crs, dst_crs, always_xy=True )
+
 class CRS(ConfigurableObject):
 
+    GEOGRAPHIC = "EPSG:4326"
+
+    @classmethod
+    def crs_key( cls, crs: CRSSpec ) -> str:
+        if hasattr( crs, "ExportToWkt" ): return crs.ExportToWkt()
+        if isinstance( crs, int ): return f"EPSG:{crs}"
+        return str( crs )
+
+    @classmethod
+    def transform( cls, src_crs: CRSSpec, dst_crs: CRSSpec, x, y ) -> Tuple:
+        """ Transforms scalar or array x, y coordinates between two CRSs (SpatialReference, WKT/proj4/EPSG string or EPSG code) using a cached transformer """
+        return get_transformer( cls.crs_key(src_crs), cls.crs_key(dst_crs) ).transform( x, y )
+
+    @classmethod
+    @functools.lru_cache( maxsize=1 )
+    def geographic_sref( cls ) -> osr.SpatialReference:
+        sref = osr.SpatialReference()
+        sref.ImportFromEPSG(4326)
+        return sref
+
     @classmethod
     def get_utm_sref( cls, longitude: float, latitude: float ) -> osr.SpatialReference:
         utm_centroid_info = utm.from_latlon(latitude, longitude)
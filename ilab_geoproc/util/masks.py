@@ -0,0 +1,50 @@
+import hashlib, threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Union, Tuple, Dict, Optional, Callable
+
+class MaskCache:
+    """  Process-wide LRU cache of rasterized polygon masks.  Entries are keyed by geometry hash and target grid, and hold the
+         mask's bounding window (row, col slices) together with the boolean mask restricted to that window. """
+
+    max_entries = 32
+    _masks: "OrderedDict[str,Tuple]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def key( cls, geometries, *grid_spec ) -> str:
+        """ Hashes the geometries' WKB together with a description of the target grid (crs, transform, shape, coordinate arrays, options) """
+        digest = hashlib.sha1()
+        for geom in geometries: digest.update( geom.wkb )
+        for item in grid_spec:
+            digest.update( item.tobytes() if isinstance( item, np.ndarray ) else repr( item ).encode() )
+        return digest.hexdigest()
+
+    @classmethod
+    def get( cls, key: str, rasterize: Callable[[],np.ndarray] ) -> Tuple[Optional[Tuple[slice,slice]],np.ndarray,Tuple[int,int]]:
+        """ Returns ( window, windowed mask, full mask shape ), calling rasterize() for the full boolean mask on a miss.  window is None if the mask is empty. """
+        with cls._lock:
+            entry = cls._masks.get( key )
+            if entry is not None: cls._masks.move_to_end( key )
+        if entry is None:
+            mask: np.ndarray = np.asarray( rasterize(), dtype=bool )
+            rows, cols = np.flatnonzero( mask.any( axis=1 ) ), np.flatnonzero( mask.any( axis=0 ) )
+            if rows.size == 0: entry = ( None, mask[:0,:0], mask.shape )
+            else:
+                window = ( slice( rows[0], rows[-1] + 1 ), slice( cols[0], cols[-1] + 1 ) )
+                entry = ( window, np.ascontiguousarray( mask[window] ), mask.shape )
+            with cls._lock:
+                cls._masks[ key ] = entry
+                while len( cls._masks ) > cls.max_entries: cls._masks.popitem( last=False )
+        return entry
+
+    @classmethod
+    def full_mask( cls, entry: Tuple ) -> np.ndarray:
+        window, mask, shape = entry
+        result = np.zeros( shape, dtype=bool )
+        if window is not None: result[window] = mask
+        return result
+
+    @classmethod
+    def clear( cls ):
+        with cls._lock: cls._masks.clear()
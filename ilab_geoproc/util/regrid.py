@@ -0,0 +1,50 @@
+import numpy as np
+import xarray as xr
+from typing import List, Union, Tuple, Dict, Optional
+
+class GridIndexMap:
+    """  Nearest-neighbour index mapping from a source grid onto a target grid, over the dims of the source that are indexed in the target.
+         Built once per pair of grids, it is applied to any number of source arrays as integer take operations, and reproduces
+         DataArray.interp_like( target, method='nearest' ): target points outside the extent of the source grid are filled with NaN. """
+
+    def __init__( self, source: xr.DataArray, target: xr.DataArray ):
+        self.dims: List[str] = [ dim for dim in source.dims if dim in target.indexes ]
+        self.source_coords: Dict[str,np.ndarray] = { dim: source.coords[dim].values for dim in self.dims }
+        self.target_coords: Dict[str,np.ndarray] = { dim: target.coords[dim].values for dim in self.dims }
+        self.indices: Dict[str,np.ndarray] = {}
+        self.valid: Dict[str,np.ndarray] = {}
+        for dim in self.dims:
+            self.indices[dim], self.valid[dim] = self.nearest_indices( self.source_coords[dim], self.target_coords[dim] )
+        self.identity = all( np.array_equal( self.indices[dim], np.arange( self.source_coords[dim].shape[0] ) ) and self.valid[dim].all() for dim in self.dims )
+
+    @classmethod
+    def nearest_indices( cls, source: np.ndarray, target: np.ndarray ) -> Tuple[np.ndarray,np.ndarray]:
+        """ Index of the nearest source coordinate for each target coordinate ( ties go to the lower coordinate ), and a flag marking targets within the source extent """
+        if np.issubdtype( source.dtype, np.datetime64 ):
+            source, target = source.astype( 'datetime64[ns]' ).astype( np.int64 ), target.astype( 'datetime64[ns]' ).astype( np.int64 )
+        order = np.argsort( source, kind='stable' )
+        ordered = source[order]
+        if ordered.shape[0] == 1: return np.zeros( target.shape, dtype=np.intp ), ( target == ordered[0] )
+        bounds = ( ordered[1:] + ordered[:-1] ) / 2.0
+        indices = order[ np.searchsorted( bounds, target, side='left' ) ]
+        return indices, ( target >= ordered[0] ) & ( target <= ordered[-1] )
+
+    def matches( self, source: xr.DataArray, target: xr.DataArray ) -> bool:
+        if [ dim for dim in source.dims if dim in target.indexes ] != self.dims: return False
+        return all( np.array_equal( source.coords[dim].values, self.source_coords[dim] ) and np.array_equal( target.coords[dim].values, self.target_coords[dim] ) for dim in self.dims )
+
+    def apply( self, data: xr.DataArray, fill_value = np.nan ) -> xr.DataArray:
+        """ Regrids data, which must have the dims and coordinates of the source grid, onto the target grid """
+        target_coords = { dim: self.target_coords[dim] for dim in self.dims }
+        if self.identity: return data.assign_coords( **target_coords )
+        values: np.ndarray = data.values
+        outside = np.zeros( [ 1 ] * data.ndim, dtype=bool )
+        for dim in self.dims:
+            axis = data.dims.index( dim )
+            values = np.take( values, self.indices[dim], axis=axis )
+            outside = outside | ~self.valid[dim].reshape( [ -1 if iD == axis else 1 for iD in range( data.ndim ) ] )
+        if outside.any():
+            values = values.astype( np.result_type( values.dtype, np.float32 ) if np.isnan( fill_value ) else values.dtype, copy=False )
+            values[ np.broadcast_to( outside, values.shape ) ] = fill_value
+        coords = { name: coord for name, coord in data.coords.items() if not ( set( coord.dims ) & set( self.dims ) ) }
+        return xr.DataArray( values, dims=data.dims, coords=dict( coords, **target_coords ), attrs=data.attrs, name=data.name )
@@ -0,0 +1,43 @@
+import os, time, tempfile, threading
+import numpy as np
+import rasterio, rasterio.io
+from rasterio.transform import from_origin
+from geoproc.xext.xrio import XRio
+
+def write_tiles( data_dir: str, ntiles: int ):
+    file_paths = []
+    for iT in range( ntiles ):
+        file_path = os.path.join( data_dir, f"MWP_2019{200+iT:03d}_120W050N_2D2OT.tif" )
+        with rasterio.open( file_path, "w", driver="GTiff", height=64, width=64, count=1, dtype="uint8", crs="EPSG:4326", transform=from_origin( -120.0, 50.0, 0.01, 0.01 ) ) as dst:
+            dst.write( np.full( ( 1, 64, 64 ), iT % 4, dtype=np.uint8 ) )
+        file_paths.append( file_path )
+    return file_paths
+
+def test_concurrent_reads():
+    """ XRio.load with max_workers > 1 must read several files at the same time (i.e. not under the global rasterio lock) """
+    active = dict( count=0, max=0 )
+    active_lock = threading.Lock()
+    base_read = rasterio.io.DatasetReader.read
+
+    def tracked_read( self, *args, **kwargs ):
+        with active_lock: active['count'] += 1; active['max'] = max( active['max'], active['count'] )
+        try:
+            time.sleep( 0.1 )
+            return base_read( self, *args, **kwargs )
+        finally:
+            with active_lock: active['count'] -= 1
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        file_paths = write_tiles( data_dir, 8 )
+        rasterio.io.DatasetReader.read = tracked_read
+        try:
+            result = XRio.load( file_paths, band=0, dtype=None, max_workers=4 )
+        finally:
+            rasterio.io.DatasetReader.read = base_read
+    assert result.shape == ( 8, 64, 64 )
+    assert np.array_equal( result.values[:,0,0], np.arange( 8 ) % 4 )
+    assert active['max'] > 1, "File reads were serialized"
+    print( f"Concurrent reads: {active['max']}" )
+
+if __name__ == '__main__':
+    test_concurrent_reads()
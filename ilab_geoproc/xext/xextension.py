@@ -1,8 +1,23 @@
-import numpy as np, os
+import numpy as np, os, functools
 from osgeo import osr
 import xarray as xr
 from typing import Dict, List, Tuple, Union, Optional
 
+@functools.lru_cache( maxsize=64 )
+def parse_sref( crs: str, wkt: bool = False ) -> osr.SpatialReference:
+    """ Process-wide LRU cache of parsed spatial references, keyed by crs string.  Never hand these out directly: callers get clones """
+    sref = osr.SpatialReference()
+    if wkt:
+        sref.ImportFromWkt( crs )
+    elif "epsg" in crs.lower():
+        espg = int(crs.split(":")[-1])
+        sref.ImportFromEPSG(espg)
+    elif "+proj" in crs.lower():
+        sref.ImportFromProj4(crs)
+    else:
+        raise Exception(f"Unrecognized crs: {crs}")
+    return sref
+
 class XExtension(object):
     """  This is the base class for xarray extensions """
 
@@ -10,11 +25,40 @@ class XExtension(object):
 
     def __init__(self, xarray_obj: xr.DataArray):
         self._obj: xr.DataArray = xarray_obj
-        self.y_coord = self.getCoordName('y')
-        self.x_coord = self.getCoordName('x')
-        self.time_coord = self.getCoordName('t')
-        self._crs: osr.SpatialReference = self.getSpatialReference()
-        self._geotransform = self.getTransform()
+        self._coord_names: Optional[Dict[str,Optional[str]]] = None
+        self._sref: Optional[osr.SpatialReference] = None
+
+    @property
+    def coord_names(self) -> Dict[str,Optional[str]]:
+        """ Axis -> coordinate name map, computed in a single pass on first access and kept for the life of the accessor """
+        if self._coord_names is None:
+            self._coord_names = { axis: None for axis in self.StandardAxisNames }
+            for cname, coord in self._obj.coords.items():
+                for axis, name in self._coord_names.items():
+                    if (name is None) and ( (str(cname).lower() in self.StandardAxisNames[axis]) or (coord.attrs.get("axis") == axis) or (axis == cname) or axis in coord.dims ):
+                        self._coord_names[axis] = str(cname)
+        return self._coord_names
+
+    @property
+    def x_coord(self) -> Optional[str]:
+        return self.coord_names['x']
+
+    @property
+    def y_coord(self) -> Optional[str]:
+        return self.coord_names['y']
+
+    @property
+    def time_coord(self) -> Optional[str]:
+        return self.coord_names['t']
+
+    @property
+    def _crs(self) -> osr.SpatialReference:
+        if self._sref is None: self._sref = self.getSpatialReference()
+        return self._sref
+
+    @property
+    def _geotransform(self):
+        return self.getTransform()
 
     def set_persistent_attribute(self, name: str, value: str ):
         self._obj.attrs[ name ] = value
@@ -38,31 +82,22 @@ class XExtension(object):
         return self._obj[self.y_coord].values
 
     def getCoordName( self, axis: str ) -> Optional[str]:
-        for cname, coord in self._obj.coords.items():
-            if (str(cname).lower() in self.StandardAxisNames[axis]) or (coord.attrs.get("axis") == axis) or (axis == cname) or axis in coord.dims:
-                return str(cname)
-        return None
+        return self.coord_names[axis]
 
     def getSpatialReference( self ) -> osr.SpatialReference:
-        sref = osr.SpatialReference()
         crs = self._obj.attrs.get('crs')
         if crs is None:
+            crs_wkt = None
             if hasattr( self._obj, 'spatial_ref'):
                 sr = self._obj.spatial_ref
                 crs_wkt = sr.attrs.get( "crs_wkt", sr.attrs.get( "spatial_ref", None ) )
-                if crs_wkt: sref.ImportFromWkt( crs_wkt )
-                else: sref.ImportFromEPSG(4326)
-            else:
-                sref.ImportFromEPSG(4326)
-        else:
-            if "epsg" in crs.lower():
-                espg = int(crs.split(":")[-1])
-                sref.ImportFromEPSG(espg)
-            elif "+proj" in crs.lower():
-                sref.ImportFromProj4(crs)
-            else:
-                raise Exception(f"Unrecognized crs: {crs}")
-        return sref
+            return self.parseSpatialReference( crs_wkt if crs_wkt else "epsg:4326", wkt = bool(crs_wkt) )
+        return self.parseSpatialReference( crs )
+
+    @classmethod
+    def parseSpatialReference( cls, crs: str, wkt: bool = False ) -> osr.SpatialReference:
+        """ Parses an epsg, proj4 or (if wkt) WKT crs string.  Parsing is cached (see parse_sref); the returned object is a private clone """
+        return parse_sref( crs, wkt ).Clone()
 
     @property
     def resolution(self):
@@ -77,16 +112,17 @@ class XExtension(object):
             res = self._obj.attrs.get('res')
 
             if y_arr.ndim < 2:
-                x_2d, y_2d = np.meshgrid(x_arr, y_arr)
+                x_vals, y_vals = x_arr.values, y_arr.values
+                x_cell_size = np.nanmean(np.absolute(np.diff(x_vals))) if res is None else res[1]
+                y_cell_size = np.nanmean(np.absolute(np.diff(y_vals))) if res is None else res[0]
+                x_origin, y_origin = x_vals[0], y_vals[0]
             else:
-                x_2d = x_arr
-                y_2d = y_arr
-
-            x_cell_size = np.nanmean(np.absolute(np.diff(x_2d, axis=1))) if res is None else res[1]
-            y_cell_size = np.nanmean(np.absolute(np.diff(y_2d, axis=0))) if res is None else res[0]
+                x_cell_size = np.nanmean(np.absolute(np.diff(x_arr, axis=1))) if res is None else res[1]
+                y_cell_size = np.nanmean(np.absolute(np.diff(y_arr, axis=0))) if res is None else res[0]
+                x_origin, y_origin = x_arr.values[0, 0], y_arr.values[0, 0]
 
-            min_x_tl = x_2d[0, 0] - x_cell_size / 2.0
-            max_y_tl = y_2d[0, 0] + y_cell_size / 2.0
+            min_x_tl = x_origin - x_cell_size / 2.0
+            max_y_tl = y_origin + y_cell_size / 2.0
             transform = min_x_tl, x_cell_size, 0, max_y_tl, 0, -y_cell_size
             self._obj.attrs['transform'] = transform
         return transform
@@ -2,7 +2,7 @@ from affine import Affine
 import numpy as np, os
 from geoproc.util.configuration import ConfigurableObject, Region
 from geoproc.util.crs import CRS
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 from osgeo import osr, gdalconst, gdal
 from pyproj import Proj, transform
 from geoproc.data.grid import GDALGrid
@@ -27,7 +27,7 @@ class XGeo(XExtension):
         band: int = args.get("band",-1)
         grid = GDALGrid( filePath )
         if name is None: name = os.path.basename(filePath)
-        return grid.xarray( name, band )
+        return grid.xarray( name, band, lazy=args.get( "lazy", False ) )
 
     @classmethod
     def loadRasterFiles( cls, filePaths: List[str], **args ) -> List[xr.DataArray]:
@@ -38,9 +38,39 @@ class XGeo(XExtension):
             data_arrays: List[xr.DataArray] = [ cls.loadRasterFile( file, **args )[ bbox.origin[1]:bbox.bounds[1], bbox.origin[0]:bbox.bounds[0] ] for file in filePaths]
         return data_arrays
 
-    def countInstances(self, values: List[int] ) -> xr.DataArray:
-        counts = ( [( self._obj == cval ).sum(dim=[self.x_coord,self.y_coord],keep_attrs=True) for cval in values] )
-        return xr.concat( counts, 'counts' ).transpose()
+    def countInstances(self, values: List[int], poly: Polygon = None, mask: np.ndarray = None ) -> xr.DataArray:
+        """ Counts the pixels equal to each of values with one histogram pass per slice, optionally restricted to pixels inside poly
+            (in the array's crs) and/or a boolean (y,x) mask.  Returns counts with dims ( *non-spatial dims, 'counts' ) """
+        data: xr.DataArray = self._obj.transpose( ..., self.y_coord, self.x_coord )
+        other_dims = data.dims[:-2]
+        slices: np.ndarray = data.values.reshape( [-1, data.shape[-2] * data.shape[-1]] )
+        if poly is not None:
+            from rasterio.features import geometry_mask
+            poly_mask = geometry_mask( [poly], data.shape[-2:], Affine.from_gdal( *self.getTransform() ), invert=True )
+            mask = poly_mask if mask is None else ( poly_mask & np.asarray( mask, dtype=bool ) )
+        if mask is not None: slices = slices[ :, np.asarray( mask, dtype=bool ).ravel() ]
+        nvals = len( values )
+        counts = np.empty( [ slices.shape[0], nvals ], dtype=np.int64 )
+        for iS in range( slices.shape[0] ):
+            counts[iS] = np.bincount( self.class_codes( slices[iS], values ), minlength=nvals+1 )[:nvals]
+        coords = { dim: data.coords[dim] for dim in other_dims if dim in data.coords }
+        return xr.DataArray( counts.reshape( data.shape[:-2] + (nvals,) ), dims = other_dims + ('counts',), coords=coords, attrs=self._obj.attrs )
+
+    @classmethod
+    def class_codes( cls, data: np.ndarray, values: List[int] ) -> np.ndarray:
+        """ Maps each element of data to the index of its value in values, or len(values) if it matches none of them """
+        values = np.asarray( values )
+        nvals = values.size
+        if ( data.dtype.kind in 'iu' ) and ( data.dtype.itemsize <= 2 ):
+            info = np.iinfo( data.dtype )
+            in_range = ( values >= info.min ) & ( values <= info.max ) & ( values == np.floor( values ) )
+            lut = np.full( int(info.max) - int(info.min) + 1, nvals, dtype=np.intp )
+            lut[ values[in_range].astype( np.int64 ) - int(info.min) ] = np.arange( nvals )[in_range]
+            return lut[ data ] if info.min == 0 else lut[ data.astype( np.int32 ) - int(info.min) ]
+        order = np.argsort( values, kind='stable' )
+        sorted_values = values[order]
+        index = np.clip( np.searchsorted( sorted_values, data ), 0, nvals - 1 )
+        return np.where( sorted_values[index] == data, order[index], nvals )
 
     def regionmask( self, name: str, poly: Polygon ) -> regionmask.Region_cls:
         return regionmask.Region_cls( 0, name, name, poly )
@@ -66,20 +96,53 @@ class XGeo(XExtension):
         bnds = [ min_x, max_y + y_step*self._obj.shape[-2], min_x + x_step*self._obj.shape[-1], max_y ]
         if geographic or sref:
             if geographic: sref = self.geographic_sref
-            gbnds0 = self.project_coords( bnds[0], bnds[1], sref )
-            gbnds1 = self.project_coords( bnds[2], bnds[3], sref )
-            return gbnds0 + gbnds1
+            xs, ys = self.project_coords( np.array( bnds[0::2] ), np.array( bnds[1::2] ), sref )
+            return ( xs[0], ys[0], xs[1], ys[1] )
         return bnds
 
+    def cell_areas( self ) -> np.ndarray:
+        """ Area (km^2) of each (y,x) grid cell: per row on the authalic sphere for geographic grids, constant for projected grids (in meters) """
+        resolution = self.resolution
+        shape = ( self._obj.sizes[self.y_coord], self._obj.sizes[self.x_coord] )
+        if not self._crs.IsGeographic():
+            return np.full( shape, abs( resolution[0] * resolution[1] ) / 1.0e6 )
+        earth_radius = 6371.0072
+        lats = np.radians( self.ycoords.astype( np.float64 ) )
+        half_height = np.radians( abs( resolution[1] ) ) / 2.0
+        row_areas = earth_radius**2 * np.radians( abs( resolution[0] ) ) * np.abs( np.sin( lats + half_height ) - np.sin( lats - half_height ) )
+        return np.broadcast_to( row_areas.reshape( -1, 1 ), shape ).copy()
+
     def to_utm( self, resolution: Tuple[float,float], **kwargs ) -> xr.DataArray:
         utm_sref: osr.SpatialReference = kwargs.get( 'sref', self.getUTMProj() )
-        gdalWaterMask: GDALGrid = self.to_gdalGrid()
-        utmGdalWaterMask = gdalWaterMask.reproject( utm_sref, resolution=resolution )
+        if kwargs.get( 'plan', False ): return self.to_utm_plan( utm_sref, resolution, **kwargs )
+        gdalWaterMask: GDALGrid = self.to_gdalGrid( dtype=kwargs.get('dtype'), nodata=kwargs.get('nodata') )
+        dtype = None if kwargs.get('dtype') is None else gdalWaterMask.dataset.GetRasterBand(1).DataType
+        utmGdalWaterMask = gdalWaterMask.reproject( utm_sref, resolution=resolution, dtype=dtype )
         result =  utmGdalWaterMask.xarray( f"{self._obj.name}-utm", time_axis =self._obj.coords["time"] )
         result.attrs['SpatialReference'] = utm_sref
         result.attrs['resolution'] = resolution
         return result
 
+    def to_utm_plan( self, utm_sref: osr.SpatialReference, resolution: Tuple[float,float], **kwargs ) -> xr.DataArray:
+        """ Nearest-neighbour UTM reprojection using a cached WarpPlan, applied to all time slices in a single gather """
+        from geoproc.data.grid import WarpPlan
+        dtype = kwargs.get('dtype')
+        nodata = kwargs.get( 'nodata', self._obj.attrs.get('nodatavals',[None])[0] )
+        plan: WarpPlan = WarpPlan.get( self.grid_template(), utm_sref, resolution )
+        data: np.ndarray = self._obj.values.astype( np.float32 if dtype is None else np.dtype(dtype), copy=False )
+        fill_value = nodata if ( dtype is not None ) and ( nodata is not None ) else 0
+        result = plan.dst_grid.wrap_array( plan.apply( data, fill_value, nodata ), f"{self._obj.name}-utm", time_axis = self._obj.coords["time"] if data.ndim == 3 else None )
+        result.attrs['SpatialReference'] = utm_sref
+        result.attrs['resolution'] = resolution
+        return result
+
+    def grid_template(self) -> GDALGrid:
+        """ Returns a single-band Byte MEM grid with this array's geotransform and projection (but none of its data) """
+        dataset: gdal.Dataset = gdal.GetDriverByName('MEM').Create( "GdalTemplate", self._obj.shape[-1], self._obj.shape[-2], 1, gdalconst.GDT_Byte )
+        dataset.SetGeoTransform( self._geotransform )
+        dataset.SetProjection( self._crs.ExportToWkt() )
+        return GDALGrid( dataset )
+
     def gdal_reproject( self, **kwargs ) -> xr.DataArray:
         sref = osr.SpatialReference()
         proj4 = kwargs.get( 'proj4', None )
@@ -133,26 +196,30 @@ class XGeo(XExtension):
 
     @property
     def geographic_sref(self):
-        sref = osr.SpatialReference()
-        sref.ImportFromEPSG(4326)
-        return sref
+        return CRS.geographic_sref()
 
     def project_to_geographic( self, x_coord: float, y_coord: float ) -> Tuple[float,float]:
         return self.project_coords( x_coord, y_coord, self.geographic_sref )
 
     def project_coords( self, x_coord: float, y_coord: float, sref: osr.SpatialReference ) -> Tuple[float,float]:
-        trans = osr.CoordinateTransformation( self._crs, sref )
-        return trans.TransformPoint( x_coord, y_coord )[:2]
+        """ Projects a point (or coordinate arrays) from this array's CRS to sref, using a cached transformer """
+        return tuple( CRS.transform( self._crs, sref, x_coord, y_coord ) )
 
     def resample_to_target(self, target: xr.DataArray, dims_map: Dict[str,str]) -> xr.DataArray:
         dim_args = { dim0: target[dim1] for dim0,dim1 in dims_map.items() }
         return self._obj.interp(**dim_args)
 
-    def to_gdal(self) -> gdal.Dataset:
+    def to_gdal( self, dtype: Optional[np.dtype] = None, nodata: Optional[float] = None ) -> gdal.Dataset:
+        """ Copies the array into a MEM dataset, as Float32 unless a (e.g. compact integer) dtype is specified """
+        from osgeo import gdal_array
         in_array: np.ndarray = self._obj.values
         num_bands = 1
-        nodata_value = self._obj.attrs.get('nodatavals',[None])[0]
-        gdal_dtype = gdalconst.GDT_Float32
+        nodata_value = self._obj.attrs.get('nodatavals',[None])[0] if nodata is None else nodata
+        if dtype is None:
+            gdal_dtype = gdalconst.GDT_Float32
+        else:
+            in_array = in_array.astype( np.dtype(dtype), copy=False )
+            gdal_dtype = gdal_array.NumericTypeCodeToGDALTypeCode( in_array.dtype )
         proj = self._crs.ExportToWkt()
 
         if in_array.ndim == 3:  num_bands, y_size, x_size = in_array.shape
@@ -177,11 +244,11 @@ class XGeo(XExtension):
 
         return dataset
 
-    def to_gdalGrid(self) -> GDALGrid:
-        return GDALGrid( self.to_gdal())
+    def to_gdalGrid( self, **kwargs ) -> GDALGrid:
+        return GDALGrid( self.to_gdal( **kwargs ) )
 
-    def to_tif(self, file_path: str ):
-        gdalGrid = self.to_gdalGrid()
+    def to_tif(self, file_path: str, **kwargs ):
+        gdalGrid = self.to_gdalGrid( **kwargs )
         gdalGrid.to_tif( file_path )
 
 if __name__ == '__main__':
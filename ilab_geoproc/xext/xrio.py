@@ -1,13 +1,13 @@
-from typing import List, Union, Tuple, Optional
+from typing import List, Union, Tuple, Optional, Iterator, Dict
 import pandas as pd
 from geoproc.xext.xextension import XExtension
 from geopandas import GeoDataFrame
-import os, warnings, ntpath
+import os, warnings, ntpath, collections
 import numpy as np
 from shapely.geometry import box, mapping
 from geoproc.util.configuration import argfilter
 import rioxarray, traceback
-import rasterio
+import rasterio, rasterio.windows
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 import xarray as xr
 
@@ -22,13 +22,15 @@ class XRio(XExtension):
     def open( cls, iFile: int, filename: str, **kwargs )-> Optional[xr.DataArray]:
         mask = kwargs.pop("mask", None)
         kill_zombies = kwargs.pop( "kill_zombies", False )
+        dtype = kwargs.pop( "dtype", 'f4' )
         oargs = argfilter( kwargs, parse_coordinates = None, chunks = None, cache = None, lock = None )
         try:
-            result: xr.DataArray = rioxarray.open_rasterio( filename, **oargs ).astype( np.dtype('f4') )
+            result: xr.DataArray = rioxarray.open_rasterio( filename, **oargs )
+            if dtype is not None: result = result.astype( np.dtype(dtype) )
             band = kwargs.pop( 'band', -1 )
             if band >= 0:
                 result = result.isel( band=band, drop=True )
-            result.encoding = dict( dtype = str(np.dtype('f4')) )
+            result.encoding = dict( dtype = str(result.dtype) )
             if mask is None: return result
             elif isinstance( mask, list ):
                 return result.xrio.subset( iFile, mask[:2], mask[2:] )
@@ -47,7 +49,7 @@ class XRio(XExtension):
     def subset(self, iFile: int, xbounds: List, ybounds: List )-> xr.DataArray:
         from geoproc.surfaceMapping.util import TileLocator
         tile_bounds = TileLocator.get_bounds(self._obj)
-        xbounds.sort(), ybounds.sort( reverse = (tile_bounds[2] > tile_bounds[3]) )
+        xbounds.sort(), ybounds.sort( reverse = bool( tile_bounds[2] > tile_bounds[3] ) )
         if iFile == 0:
             print( f"Subsetting array with bounds {tile_bounds} by xbounds = {xbounds}, ybounds = {ybounds}")
         sel_args = { self._obj.dims[-1]: slice(*xbounds), self._obj.dims[-2]: slice(*ybounds) }
@@ -57,18 +59,43 @@ class XRio(XExtension):
         cargs = argfilter( kwargs, all_touched = True, drop = True )
         mask_value = int( kwargs.pop( 'mask_value', 255  ) )
         self._obj.rio.set_nodata(mask_value)
-        result = self._obj.rio.clip( geodf.geometry.apply(mapping), geodf.crs, **cargs )
+        if cargs['drop'] and kwargs.get( 'cache_mask', True ):
+            result = self.clip_cached( geodf, mask_value, cargs['all_touched'] )
+        else:
+            result = self._obj.rio.clip( geodf.geometry.apply(mapping), geodf.crs, **cargs )
         result.attrs['mask_value'] = mask_value
         result.encoding = self._obj.encoding
         return result
 
+    def clip_cached(self, geodf: GeoDataFrame, mask_value: int, all_touched: bool = True )-> xr.DataArray:
+        """ Equivalent to rio.clip( ..., drop=True ), but the rasterized polygon mask and its window are cached (see MaskCache),
+            so clipping a stack of rasters on the same grid rasterizes the polygon only once """
+        from geoproc.util.masks import MaskCache
+        from rasterio.features import geometry_mask
+        from rioxarray.exceptions import NoDataInBounds
+        rio = self._obj.rio
+        transform, shape = rio.transform( recalc=True ), ( int(rio.height), int(rio.width) )
+        def rasterize() -> np.ndarray:
+            geometries = geodf.geometry.apply(mapping)
+            if ( geodf.crs is not None ) and ( rio.crs != geodf.crs ):
+                geometries = rasterio.warp.transform_geom( geodf.crs, rio.crs, geometries )
+            return geometry_mask( geometries, out_shape=shape, transform=transform, invert=True, all_touched=all_touched )
+        key = MaskCache.key( geodf.geometry, str(geodf.crs), str(rio.crs), tuple(transform), shape, all_touched )
+        window, mask, _ = MaskCache.get( key, rasterize )
+        if window is None: raise NoDataInBounds( f"No data found in bounds." )
+        subset: xr.DataArray = self._obj.isel( { rio.y_dim: window[0], rio.x_dim: window[1] } )
+        data: np.ndarray = subset.values
+        keep = ( mask & ~np.isnan( data ) ) if np.issubdtype( data.dtype, np.floating ) else mask
+        result = subset.copy( data = np.where( keep, data, np.array( mask_value ).astype( data.dtype ) ) )
+        window_transform = rasterio.windows.transform( rasterio.windows.Window.from_slices( rows=window[0], cols=window[1] ), transform )
+        return result.rio.write_transform( window_transform ).rio.write_crs( rio.crs ).rio.write_nodata( mask_value )
+
     @classmethod
     def print_array_dims( cls, filePaths: Union[ str, List[str] ], **kwargs ):
         if isinstance( filePaths, str ): filePaths = [ filePaths ]
         result: xr.DataArray = None
         print(f" ARRAY DIMS " )
-        for iF, file in enumerate(filePaths):
-            data_array: xr.DataArray = cls.open( iF, file, **kwargs )
+        for iF, file, data_array in cls.open_files( filePaths, **kwargs ):
             if data_array is not None:
                 time_values = np.array([ cls.get_date_from_filename(os.path.basename(file)) ], dtype='datetime64[ns]')
                 data_array = data_array.expand_dims( { 'time': time_values }, 0 )
@@ -78,17 +105,79 @@ class XRio(XExtension):
     @classmethod
     def load( cls, filePaths: Union[ str, List[str] ], **kwargs ) -> Union[ List[xr.DataArray], xr.DataArray ]:
         if isinstance( filePaths, str ): filePaths = [ filePaths ]
-        result: xr.DataArray = None
-        for iF, file in enumerate(filePaths):
-            data_array: xr.DataArray = cls.open( iF, file, **kwargs )
+        if kwargs.pop( 'lazy', False ):
+            kwargs.pop( 'max_workers', None )
+            return cls.load_lazy( filePaths, **kwargs )
+        template: xr.DataArray = None
+        buffer: np.ndarray = None
+        time_values = []
+        for iF, file, data_array in cls.open_files( filePaths, **kwargs ):
             if data_array is not None:
-                time_values = np.array([ cls.get_date_from_filename(os.path.basename(file)) ], dtype='datetime64[ns]')
-                data_array = data_array.expand_dims( { 'time': time_values }, 0 )
-                result = data_array if result is None else cls.concat([result, data_array])
-                # try:
-                # except ValueError as err:
-                #     print( f"SKIPPED concatenating array[{iF}:{ntpath.basename(file)}], shape: {data_array.shape}, due to error: {err}")
-        return result
+                if template is None:
+                    template = data_array
+                    buffer = np.empty( [ len(filePaths) ] + list(data_array.shape), dtype=data_array.dtype )
+                elif data_array.shape != template.shape:
+                    raise ValueError( f"Array[{iF}:{ntpath.basename(file)}] shape {data_array.shape} does not match shape {template.shape} of preceding arrays")
+                buffer[ len(time_values) ] = data_array.values
+                time_values.append( cls.get_date_from_filename(os.path.basename(file)) )
+        if template is None: return None
+        return cls.stack( template, buffer[ :len(time_values) ], time_values )
+
+    @classmethod
+    def open_files( cls, filePaths: List[str], **kwargs ) -> Iterator[Tuple[int,str,Optional[xr.DataArray]]]:
+        """ Yields (index, file, array) in file order.  With max_workers > 1 the files are opened, cropped and read on a thread pool,
+            keeping at most 2*max_workers arrays in flight.  Each worker reads its own file, so unless a lock is given the files are
+            opened with lock=False: the default global rasterio lock would serialize all of the reads. """
+        max_workers = kwargs.pop( 'max_workers', None )
+        if ( max_workers is None ) or ( max_workers <= 1 ) or ( len(filePaths) < 2 ):
+            for iF, file in enumerate(filePaths):
+                yield iF, file, cls.open( iF, file, **kwargs )
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            kwargs.setdefault( 'lock', False )
+            pending = collections.deque()
+            with ThreadPoolExecutor( max_workers=max_workers ) as executor:
+                for iF, file in enumerate(filePaths):
+                    pending.append( ( iF, file, executor.submit( cls.open_and_read, iF, file, **kwargs ) ) )
+                    if len(pending) >= 2*max_workers:
+                        iF0, file0, future = pending.popleft()
+                        yield iF0, file0, future.result()
+                while pending:
+                    iF0, file0, future = pending.popleft()
+                    yield iF0, file0, future.result()
+
+    @classmethod
+    def open_and_read( cls, iFile: int, filename: str, **kwargs ) -> Optional[xr.DataArray]:
+        result: xr.DataArray = cls.open( iFile, filename, **kwargs )
+        return None if result is None else result.load()
+
+    @classmethod
+    def load_lazy( cls, filePaths: List[str], **kwargs ) -> Optional[xr.DataArray]:
+        """ Builds a dask-backed (time, y, x) array with one chunk per file; the first file is read eagerly to determine shape and coordinates. """
+        import dask, dask.array as da
+        template: xr.DataArray = cls.open( 0, filePaths[0], **kwargs ) if len(filePaths) else None
+        if template is None: return None
+        read_file = dask.delayed( cls.read_values, pure=True )
+        chunks = [ da.from_array( template.values[np.newaxis], chunks=-1 ) ]
+        for iF, file in enumerate( filePaths[1:], 1 ):
+            chunks.append( da.from_delayed( read_file( iF, file, template.shape, **kwargs ), shape=template.shape, dtype=template.dtype )[np.newaxis] )
+        time_values = [ cls.get_date_from_filename( os.path.basename(file) ) for file in filePaths ]
+        return cls.stack( template, da.concatenate( chunks, axis=0 ), time_values )
+
+    @classmethod
+    def read_values( cls, iFile: int, filename: str, shape: Tuple, **kwargs ) -> np.ndarray:
+        data_array: xr.DataArray = cls.open( iFile, filename, **kwargs )
+        if data_array is None: raise Exception( f"XRio Error reading file {filename}" )
+        if data_array.shape != shape: raise ValueError( f"Array[{iFile}:{ntpath.basename(filename)}] shape {data_array.shape} does not match expected shape {shape}")
+        return data_array.values
+
+    @classmethod
+    def stack( cls, template: xr.DataArray, data, time_values: List ) -> xr.DataArray:
+        time_coord = np.array( time_values, dtype='datetime64[ns]' )
+        if data.shape[0] == 1: return template.expand_dims( { 'time': time_coord }, 0 )
+        coords = { key: template.coords[key] for key in template.dims }
+        coords['time'] = time_coord
+        return xr.DataArray( data, dims=[ 'time' ] + list(template.dims), coords=coords )
 
     @classmethod
     def get_date_from_filename(cls, filename: str):
@@ -105,8 +194,7 @@ class XRio(XExtension):
         if isinstance( filePaths, str ): filePaths = [ filePaths ]
         array_list: List[xr.DataArray] = []
         index_mask = np.full( [len(filePaths)], True )
-        for iF, file in enumerate(filePaths):
-            data_array: xr.DataArray = cls.open( iF, file, **kwargs )
+        for iF, file, data_array in cls.open_files( filePaths, **kwargs ):
             if data_array is not None:
                 array_list.append( data_array )
             else:
@@ -165,6 +253,90 @@ class XRio(XExtension):
 #        print( f"Concat arrays along dim {array0.dims[0]}, input array dims = {array0.dims}, shape = {array0.shape}, Result array dims = {result.dims}, shape = {result.shape}")
         return result
 
+    @classmethod
+    def mosaic( cls, tiles: List[xr.DataArray], **kwargs ) -> xr.DataArray:
+        """ Mosaics (..., y, x) tiles sharing a regular grid into one array.  The output grid is computed from the tile coordinates and
+            allocated once, and each tile is copied into its slot; leading (e.g. time) coordinates are unioned, uncovered cells get fill_value
+            (default NaN, or 0 for integer data).  With consume=True tiles are popped from the list as they are written, releasing them early.
+            With lazy=True tiles forming a complete grid are assembled VRT-style into a dask array that references the tile data without copying. """
+        if len( tiles ) == 1: return tiles[0]
+        template: xr.DataArray = tiles[0]
+        dtype = np.result_type( *[ tile.dtype for tile in tiles ] )
+        fill_value = kwargs.get( 'fill_value', 0 if np.issubdtype( dtype, np.integer ) else np.nan )
+        lead_dims, grid_dims = template.dims[:-2], template.dims[-2:]
+        lead_coords = { dim: cls.coord_union( [ tile.coords[dim].values for tile in tiles ] ) for dim in lead_dims }
+        grid_coords, grid_offsets = {}, {}
+        for dim in grid_dims:
+            grid_coords[dim], grid_offsets[dim] = cls.grid_slots( [ tile.coords[dim].values for tile in tiles ] )
+        coords = { name: coord for name, coord in template.coords.items() if coord.ndim == 0 }
+        coords.update( lead_coords, **grid_coords )
+        shape = [ coords[dim].size for dim in template.dims ]
+
+        if kwargs.get( 'lazy', False ):
+            blocks = cls.tile_blocks( tiles, lead_coords, grid_offsets, shape )
+            if blocks is not None:
+                import dask.array as da
+                return xr.DataArray( da.block( blocks ), dims=template.dims, coords=coords, name=template.name, attrs=template.attrs )
+            print( "Tiles do not form a complete grid, computing mosaic eagerly" )
+
+        result_data = np.full( shape, fill_value, dtype=dtype )
+        tile_offsets = list( zip( grid_offsets[grid_dims[0]], grid_offsets[grid_dims[1]] ) )
+        consume = kwargs.get( 'consume', False )
+        for iT, ( y_offset, x_offset ) in enumerate( tile_offsets ):
+            tile = tiles.pop(0) if consume else tiles[iT]
+            index = [ cls.lead_index( lead_coords[dim], tile.coords[dim].values ) for dim in lead_dims ]
+            index += [ slice( y_offset, y_offset + tile.shape[-2] ), slice( x_offset, x_offset + tile.shape[-1] ) ]
+            if sum( not isinstance( idx, slice ) for idx in index ) > 1:
+                index = np.ix_( *[ np.arange( size )[idx] for idx, size in zip( index, shape ) ] )
+            result_data[ tuple(index) ] = tile.values
+        return xr.DataArray( result_data, dims=template.dims, coords=coords, name=template.name, attrs=template.attrs )
+
+    @classmethod
+    def coord_union( cls, coord_values: List[np.ndarray] ) -> np.ndarray:
+        values0 = coord_values[0]
+        if all( np.array_equal( values, values0 ) for values in coord_values[1:] ): return values0
+        return np.unique( np.concatenate( coord_values ) )
+
+    @classmethod
+    def grid_slots( cls, coord_values: List[np.ndarray] ) -> Tuple[np.ndarray,List[int]]:
+        """ Returns the regular coordinate axis spanning all tiles (with the tiles' own values in covered slots) and each tile's offset into it """
+        step = next( values[1] - values[0] for values in coord_values if values.size > 1 )
+        origin = min( values[0] for values in coord_values ) if step > 0 else max( values[0] for values in coord_values )
+        offsets = [ int( round( ( values[0] - origin ) / step ) ) for values in coord_values ]
+        size = max( offset + values.size for offset, values in zip( offsets, coord_values ) )
+        axis = origin + np.arange( size ) * step
+        for offset, values in zip( offsets, coord_values ): axis[ offset: offset + values.size ] = values
+        return axis, offsets
+
+    @classmethod
+    def lead_index( cls, union_values: np.ndarray, values: np.ndarray ):
+        """ Location of a tile's coordinate values in the (sorted, if it differs from any tile's) union axis, as a slice where possible """
+        if np.array_equal( union_values, values ): return slice( None )
+        index = np.searchsorted( union_values, values )
+        if ( index.size > 0 ) and np.all( np.diff( index ) == 1 ):
+            return slice( int(index[0]), int(index[-1]) + 1 )
+        return index
+
+    @classmethod
+    def tile_blocks( cls, tiles: List[xr.DataArray], lead_coords: Dict, grid_offsets: Dict, shape: List[int] ) -> Optional[List]:
+        """ Arranges the tile data into a nested list for dask.array.block, or returns None unless the tiles exactly cover the mosaic grid """
+        import dask.array as da
+        for tile in tiles:
+            for dim, values in lead_coords.items():
+                if not np.array_equal( tile.coords[dim].values, values ): return None
+        y_offsets, x_offsets = list( grid_offsets.values() )
+        grid = { ( yo, xo ): tile for yo, xo, tile in zip( y_offsets, x_offsets, tiles ) }
+        rows, cols = sorted( set( y_offsets ) ), sorted( set( x_offsets ) )
+        if len( grid ) != len( tiles ) or len( grid ) != len( rows ) * len( cols ): return None
+        blocks = [ [ grid[ (yo, xo) ] for xo in cols ] for yo in rows ]
+        heights = [ row[0].shape[-2] for row in blocks ]
+        widths = [ tile.shape[-1] for tile in blocks[0] ]
+        for iR, row in enumerate( blocks ):
+            for iC, tile in enumerate( row ):
+                if ( tile.shape[-2] != heights[iR] ) or ( tile.shape[-1] != widths[iC] ): return None
+        if ( rows != list( np.cumsum( [0] + heights[:-1] ) ) ) or ( cols != list( np.cumsum( [0] + widths[:-1] ) ) ) or ( sum( heights ), sum( widths ) ) != tuple( shape[-2:] ): return None
+        return [ [ da.asarray( tile.data ) for tile in row ] for row in blocks ]
+
     @classmethod
     def mergable(cls, arrays: List[xr.DataArray]) -> bool:
         for array in arrays: